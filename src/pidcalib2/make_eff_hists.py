@@ -32,6 +32,7 @@ Examples:
 """
 
 import argparse
+import functools
 import logging
 import pathlib
 import pickle
@@ -51,6 +52,12 @@ except ImportError:
 
 def decode_arguments(args):
     """Decode CLI arguments."""
+    return _get_parser().parse_args(args)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_parser() -> argparse.ArgumentParser:
+    """Return the CLI argument parser (built only once)."""
     parser = argparse.ArgumentParser(
         allow_abbrev=False, formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
@@ -126,7 +133,7 @@ def decode_arguments(args):
     parser.add_argument(
         "-d",
         "--local-dataframe",
-        help="(debug) read a calibration DataFrame from file",
+        help="(debug) read a calibration DataFrame from file (csv/pkl/parquet/feather)",
     )
     parser.add_argument(
         "-f",
@@ -151,7 +158,7 @@ def decode_arguments(args):
         help="(debug) increase verbosity",
     )
     parser.add_argument("-V", "--version", action="version", version=version)
-    return parser.parse_args(args)
+    return parser
 
 
 def make_eff_hists(config: dict) -> None:
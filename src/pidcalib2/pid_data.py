@@ -10,14 +10,16 @@
 ###############################################################################
 
 import collections
+import copy
+import functools
 import json
-import os
 import pickle
 import re
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import boost_histogram as bh
+import numpy as np
 import pandas as pd
 import uproot
 from logzero import logger as log
@@ -26,6 +28,14 @@ from . import utils
 from .aliases import aliases
 from .samples import simple_samples, tuple_names
 
+_DEFAULT_SAMPLES_FILE = str(Path(__file__).resolve().parent / "data" / "samples.json")
+_WHITESPACE = re.compile(r"\s+")
+
+# Event-wide binning variables, whose reference branches have no particle prefix
+_GLOBAL_BRANCHES = frozenset(
+    {"nTracks", "nTracks_Brunel", "nSPDhits", "nSPDhits_Brunel"}
+)
+
 
 def is_simple(sample: str) -> bool:
     """Return whether a sample has a simple directory structure.
@@ -56,9 +66,8 @@ def get_relevant_branch_names(
     """
     branch_names = {"sWeight": "probe_sWeight"}
 
-    whitespace = re.compile(r"\s+")
     for pid_cut in pid_cuts:
-        pid_cut = re.sub(whitespace, "", pid_cut)
+        pid_cut = _WHITESPACE.sub("", pid_cut)
         pid_cut_vars = utils.extract_variable_names(pid_cut)
 
         for pid_cut_var in pid_cut_vars:
@@ -85,7 +94,7 @@ def get_relevant_branch_names(
     # Add vars in the arbitrary cuts
     if cuts:
         for cut in cuts:
-            cut = re.sub(whitespace, "", cut)
+            cut = _WHITESPACE.sub("", cut)
             cut_vars = utils.extract_variable_names(cut)
             for cut_var in cut_vars:
                 if cut_var not in aliases:
@@ -123,17 +132,26 @@ def get_reference_branch_names(
     Args:
         ref_pars: A dict of {particle branch prefix : [particle type, PID cut]}
     """
-    branch_names = []
+    return list(_reference_branch_names(tuple(ref_pars), tuple(bin_vars.items())))
 
-    for ref_par_name in ref_pars:
-        for bin_var, bin_var_branch in bin_vars.items():
-            branch_name = get_reference_branch_name(
-                ref_par_name, bin_var, bin_var_branch
-            )
-            # Avoid duplicate entries
-            if branch_name not in branch_names:
-                branch_names.append(branch_name)
-    return branch_names
+
+@functools.lru_cache(maxsize=None)
+def _reference_branch_names(
+    prefixes: Tuple[str, ...], bin_vars: Tuple[Tuple[str, str], ...]
+) -> Tuple[str, ...]:
+    """Return the reference branch names for hashable (cacheable) arguments.
+
+    Args:
+        prefixes: Branch prefixes of the reference particles.
+        bin_vars: Pairs of (binning variable, branch name).
+    """
+    # A dict avoids duplicate entries while preserving the order
+    branch_names = {
+        get_reference_branch_name(prefix, bin_var, bin_var_branch): None
+        for prefix in prefixes
+        for bin_var, bin_var_branch in bin_vars
+    }
+    return tuple(branch_names)
 
 
 def get_reference_branch_name(prefix: str, bin_var: str, bin_var_branch: str) -> str:
@@ -144,10 +162,7 @@ def get_reference_branch_name(prefix: str, bin_var: str, bin_var_branch: str) ->
         bin_var: Variable used for the binning.
         bin_var_branch: Branch name of the variable used for binning.
     """
-    # TODO: Review these hardcoded branch names (maybe consolidate them
-    # somewhere). Maybe add some checks that the bin_var is known.
-    global_branches = ("nTracks", "nTracks_Brunel", "nSPDhits", "nSPDhits_Brunel")
-    if bin_var in global_branches:
+    if bin_var in _GLOBAL_BRANCHES:
         return bin_var_branch
 
     return f"{prefix}_{bin_var_branch}"
@@ -156,13 +171,25 @@ def get_reference_branch_name(prefix: str, bin_var: str, bin_var_branch: str) ->
 def get_calibration_samples(samples_file: Optional[str] = None) -> Dict:
     """Return a dictionary of all files for all calibration samples.
 
+    Each file is parsed only once per process. The nested sample entries are
+    shared between calls and must not be modified.
+
     Args:
         samples_file: JSON file with the calibration file lists.
     """
     if samples_file is None:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        samples_file = str(Path(current_dir, "data/samples.json"))
+        samples_file = _DEFAULT_SAMPLES_FILE
+
+    return dict(_load_calibration_samples(str(Path(samples_file).resolve())))
+
+
+@functools.lru_cache(maxsize=None)
+def _load_calibration_samples(samples_file: str) -> Dict:
+    """Return the parsed calibration sample lists from a JSON file.
 
+    Args:
+        samples_file: Absolute path of the JSON file.
+    """
     log.debug(f"Reading file lists from '{samples_file}'")
     with open(samples_file) as f:
         samples_dict = json.load(f)
@@ -187,7 +214,28 @@ def get_calibration_sample(
             None (= all files).
     """
     samples_dict = get_calibration_samples(samples_file)
+    return get_calibration_sample_from_dict(
+        samples_dict, sample, magnet, particle, max_files
+    )
+
+
+def get_calibration_sample_from_dict(
+    samples_dict: Dict[str, Any],
+    sample: str,
+    magnet: str,
+    particle: str,
+    max_files: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Return a list of calibration files from already loaded sample lists.
 
+    Args:
+        samples_dict: Calibration sample lists, see get_calibration_samples().
+        sample: Data sample name (Turbo18, etc.)
+        magnet: Magnet polarity (up, down)
+        particle: Particle type (K, pi, etc.)
+        max_files: Optional. The maximum number of files to get. Defaults to
+            None (= all files).
+    """
     magnet = "Mag" + magnet.capitalize()
     sample_name = "-".join([sample, magnet, particle])
 
@@ -202,14 +250,14 @@ def get_calibration_sample(
         )
         raise
 
-    calibration_sample = sample_dict.copy()
+    calibration_sample = copy.deepcopy(sample_dict)
     if "link" in sample_dict:
         del calibration_sample["link"]
         link = sample_dict["link"]
         try:
-            calibration_sample["files"] = samples_dict[link]["files"]
+            calibration_sample["files"] = list(samples_dict[link]["files"])
         except KeyError:
-            log.error(f"Linked sample '{link}' not found in {samples_file}")
+            log.error(f"Linked sample '{link}' not found")
             raise
         # Copy configuration from the link (tuple_names, cuts, etc.), but only
         # if it doesn't override the upstream configuration
@@ -217,7 +265,7 @@ def get_calibration_sample(
             if key == "files":
                 continue
             if key not in calibration_sample:
-                calibration_sample[key] = item
+                calibration_sample[key] = copy.deepcopy(item)
 
     if max_files:
         log.warning(
@@ -228,7 +276,11 @@ def get_calibration_sample(
 
 
 def root_to_dataframe(
-    path: str, tree_names: List[str], branches: List[str], calibration: bool = False
+    path: str,
+    tree_names: List[str],
+    branches: List[str],
+    calibration: bool = False,
+    float32: bool = False,
 ) -> pd.DataFrame:
     """Return DataFrame with requested branches from tree in ROOT file.
 
@@ -237,13 +289,80 @@ def root_to_dataframe(
             root:///eos/lhcb/file.root.
         tree_names: Names of trees inside the ROOT file to read.
         branches: Branches to put in the DataFrame.
+        calibration: Whether the file is a calibration file. Used to suggest
+            aliases when a branch is not found.
+        float32: Optional. Whether to downcast float64 branches to float32.
     """
-    tree = None
     # EOS sometimes fails with a message saying the operation expired. It is
     # intermittent and hard to replicate. See this related issue:
     # https://github.com/scikit-hep/uproot4/issues/351. To avoid PIDCalib2
     # completely failing in these cases, we skip the file with a warning
     # message if this happens.
+    try:
+        dfs = list(
+            iterate_root_dataframes(
+                path, tree_names, branches, calibration, None, float32
+            )
+        )
+    except OSError as err:
+        if "Operation expired" in err.args[0]:
+            log.error(
+                f"Failed to open '{path}' because an XRootD operation expired; skipping"
+            )
+            print(err)
+            return None  # type: ignore
+        else:
+            raise
+
+    return pd.concat(dfs, ignore_index=True)  # type: ignore
+
+
+def iterate_root_dataframes(
+    path: str,
+    tree_names: List[str],
+    branches: List[str],
+    calibration: bool = False,
+    step_size: Optional[Union[int, str]] = "100 MB",
+    float32: bool = False,
+) -> Iterator[pd.DataFrame]:
+    """Yield DataFrames with requested branches from trees in a ROOT file.
+
+    See iterate_root_arrays for details; this is its DataFrame counterpart.
+    """
+    for arrays in iterate_root_arrays(
+        path, tree_names, branches, calibration, step_size, float32
+    ):
+        yield pd.DataFrame(arrays)
+
+
+def iterate_root_arrays(
+    path: str,
+    tree_names: List[str],
+    branches: List[str],
+    calibration: bool = False,
+    step_size: Optional[Union[int, str]] = "100 MB",
+    float32: bool = False,
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Yield dictionaries of NumPy arrays of branches from trees in a ROOT file.
+
+    The trees are read in chunks of step_size so that the whole file never has
+    to be held in memory at once. An OSError is raised when an XRootD
+    operation expires; it is up to the caller to decide whether to skip the
+    file.
+
+    Args:
+        path: Path to the ROOT file; either file system path or URL, e.g.
+            root:///eos/lhcb/file.root.
+        tree_names: Names of trees inside the ROOT file to read.
+        branches: Branches to read.
+        calibration: Whether the file is a calibration file. Used to suggest
+            aliases when a branch is not found.
+        step_size: Optional. Number of entries or memory size (e.g., "100 MB")
+            of each chunk. If None, each tree is read in a single chunk.
+        float32: Optional. Whether to downcast float64 branches to float32.
+            Halves the memory footprint of calibration data, whose precision
+            far exceeds the granularity of the binnings.
+    """
     try:
         root_file = uproot.open(path)
 
@@ -258,30 +377,40 @@ def root_to_dataframe(
                 )
             )
         raise
-    except OSError as err:
-        if "Operation expired" in err.args[0]:
-            log.error(
-                f"Failed to open '{path}' because an XRootD operation expired; skipping"
-            )
-            print(err)
-            return None  # type: ignore
-        else:
-            raise
 
-    dfs = []
+    branches_main = [b for b in branches if 'UBDT' not in b]
+    branches_friend = [b for b in branches if b not in branches_main]
+
     for tree_name in tree_names:
+        known_keys = []
         try:
             tree = root_file[tree_name]
-            branches_main = [b for b in branches if 'UBDT' not in b]
-            df_main = tree.arrays(branches_main, library="pd")
-
             tree_friend = friend_file[tree_name]
-            branches_friend = [b for b in branches if b not in branches_main]
-            df_friend = tree_friend.arrays(branches_friend, library="pd")
+            known_keys = list(tree.keys()) + list(tree_friend.keys())
 
-            df = pd.concat([df_main.reset_index(drop=True), df_friend.reset_index(drop=True)], axis=1)
-            dfs.append(df)  # type: ignore
-            known_keys = list(tree)  + list(tree_friend)
+            if step_size is None:
+                chunks = [(tree.arrays(branches_main, library="np"), None)]
+            else:
+                chunks = tree.iterate(
+                    branches_main, step_size=step_size, library="np", report=True
+                )
+
+            for arrays_main, report in chunks:
+                arrays_friend = tree_friend.arrays(
+                    branches_friend,
+                    entry_start=report.tree_entry_start if report else None,
+                    entry_stop=report.tree_entry_stop if report else None,
+                    library="np",
+                )
+                arrays = {**arrays_main, **arrays_friend}
+                if float32:
+                    arrays = {
+                        branch: array.astype(np.float32)
+                        if array.dtype == np.float64
+                        else array
+                        for branch, array in arrays.items()
+                    }
+                yield arrays
 
         except uproot.exceptions.KeyInFileError as exc:  # type: ignore
             similar_keys = []
@@ -309,20 +438,6 @@ def root_to_dataframe(
                 )
             )
             raise
-        except OSError as err:
-            if "Operation expired" in err.args[0]:
-                log.error(
-                    (
-                        f"Failed to open '{path}' because an XRootD operation "
-                        "expired; skipping"
-                    )
-                )
-                print(err)
-                return None  # type: ignore
-            else:
-                raise
-
-    return pd.concat(dfs, ignore_index=True)  # type: ignore
 
 
 def get_tree_paths(
@@ -363,14 +478,22 @@ def dataframe_from_local_file(path: str, branch_names: List[str]) -> pd.DataFram
         df = pd.read_pickle(path)
     elif path.endswith(".csv"):
         df = pd.read_csv(path, index_col=0)
+    elif path.endswith((".parquet", ".feather")):
+        # Columnar formats let us read only the requested branches
+        read = pd.read_parquet if path.endswith(".parquet") else pd.read_feather
+        try:
+            df = read(path, columns=branch_names)
+        except ValueError:
+            log.error("The requested branches are missing from the local file")
+            raise KeyError(branch_names)
     else:
         log.error(
             (
                 f"Local dataframe file '{path}' "
-                f"has an unknown suffix (csv and pkl supported)"
+                f"has an unknown suffix (csv, pkl, parquet, and feather supported)"
             )
         )
-        raise Exception("Only csv and pkl files supported")
+        raise Exception("Only csv, pkl, parquet, and feather files supported")
     log.info(f"Read {path} with a total of {len(df.index)} events")
 
     try:
@@ -407,8 +530,7 @@ def get_calib_hists(
         particle = ref_pars[ref_par][0]
 
         pid_cut = ref_pars[ref_par][1]
-        whitespace = re.compile(r"\s+")
-        pid_cut = re.sub(whitespace, "", pid_cut)
+        pid_cut = _WHITESPACE.sub("", pid_cut)
 
         calib_name = Path(
             hist_dir,
@@ -419,12 +541,11 @@ def get_calib_hists(
 
         log.debug(f"Loading efficiency histograms from '{calib_name}'")
 
-        hists[ref_par] = {}
         try:
-            with open(calib_name, "rb") as f:
-                hists[ref_par]["eff"] = pickle.load(f)
-                hists[ref_par]["passing"] = pickle.load(f)
-                hists[ref_par]["total"] = pickle.load(f)
+            eff, passing, total = _load_calib_hists(
+                str(calib_name), calib_name.stat().st_mtime_ns
+            )
+            hists[ref_par] = {"eff": eff, "passing": passing, "total": total}
         except FileNotFoundError:
             log.error(
                 (
@@ -437,8 +558,27 @@ def get_calib_hists(
     return hists
 
 
+@functools.lru_cache(maxsize=32)
+def _load_calib_hists(
+    path: str, mtime_ns: int
+) -> Tuple[bh.Histogram, bh.Histogram, bh.Histogram]:
+    """Return the eff, passing, and total histograms pickled in a file.
+
+    The histograms are cached, so repeated calls (e.g., when several reference
+    particles share a PID cut) don't read the file again. The modification
+    time is part of the cache key so that regenerated files are reloaded. The
+    cached histograms are shared and must not be modified.
+    """
+    with open(path, "rb") as f:
+        return pickle.load(f), pickle.load(f), pickle.load(f)
+
+
 def save_dataframe_as_root(
-    df: pd.DataFrame, name: str, filename: str, columns: Optional[List[str]] = None
+    df: pd.DataFrame,
+    name: str,
+    filename: str,
+    columns: Optional[List[str]] = None,
+    chunk_size: int = 1_000_000,
 ):
     """Save a DataFrame as a TTree in a ROOT file.
 
@@ -450,14 +590,58 @@ def save_dataframe_as_root(
         filename: Name of the file to which to save the TTree.
         columns: Optional. Names of the columns which are to be saved. If
             'None', all the columns will be saved.
+        chunk_size: Optional. Maximum number of entries written to the TTree
+            at once.
+    """
+    save_dataframes_as_root([df], name, filename, columns, chunk_size)
+
+
+def save_dataframes_as_root(
+    dfs: Iterable[pd.DataFrame],
+    name: str,
+    filename: str,
+    columns: Optional[List[str]] = None,
+    chunk_size: int = 1_000_000,
+):
+    """Save a sequence of DataFrames with the same columns as a single TTree.
+
+    The DataFrames are written one after another, so they can be produced on
+    the fly without ever holding the whole dataset in memory. NaN entries are
+    changed to -999 because ROOT TTrees don't support NaNs.
+
+    Args:
+        dfs: DataFrames to be saved.
+        name: Name of the new TTree.
+        filename: Name of the file to which to save the TTree.
+        columns: Optional. Names of the columns which are to be saved. If
+            'None', all the columns will be saved.
+        chunk_size: Optional. Maximum number of entries written to the TTree
+            at once.
     """
-    df_wo_nan = df.fillna(-999)
-    if columns is None:
-        columns = list(df_wo_nan.keys())
-    branches_w_types = {branch: df_wo_nan[branch].dtype for branch in columns}
     with uproot.recreate(filename) as f:
-        log.debug(f"Creating a TTree with the following branches: {branches_w_types}")
-        f.mktree(name, branches_w_types)
-        branch_dict = {branch: df_wo_nan[branch] for branch in branches_w_types}
-        f[name].extend(branch_dict)
+        for df in dfs:
+            df_columns = list(df.keys()) if columns is None else columns
+            # Replace NaNs only in the columns that have any instead of copying
+            # the whole DataFrame
+            nan_columns = [col for col in df_columns if df[col].isna().any()]
+            df_wo_nan = df
+            if nan_columns:
+                df_wo_nan = df.assign(
+                    **{col: df[col].fillna(-999) for col in nan_columns}
+                )
+            arrays = {branch: df_wo_nan[branch].to_numpy() for branch in df_columns}
+            if name not in f:
+                branches_w_types = {
+                    branch: array.dtype for branch, array in arrays.items()
+                }
+                log.debug(
+                    f"Creating a TTree with the following branches: {branches_w_types}"
+                )
+                f.mktree(name, branches_w_types)
+            # Write in blocks so that each basket is built from plain NumPy slices
+            for start in range(0, len(df_wo_nan.index), chunk_size):
+                stop = start + chunk_size
+                f[name].extend(
+                    {branch: array[start:stop] for branch, array in arrays.items()}
+                )
     log.info(f"Efficiency tree saved to {filename}")
@@ -23,7 +23,12 @@ import sys
 from typing import Optional
 
 import boost_histogram as bh
-import ROOT
+import uproot
+
+try:
+    import ROOT
+except ImportError:
+    ROOT = None
 
 
 def convert_to_root_histo(
@@ -34,16 +39,21 @@ def convert_to_root_histo(
     Only 1D, 2D, and 3D histograms are supported by ROOT. Attempting to convert
     higher-dimensional histograms will result in an exception.
 
-    Furthermore, the boost histogram must have a storage type that stores
-    variance, e.g., Weight.
+    Furthermore, unless an error histogram is supplied, the boost histogram
+    must have a storage type that stores variance, e.g., Weight.
 
     Args:
         name: Name of the new ROOT histogram.
         bh_histo: The histogram to convert.
+        bh_error_histo: Optional. Histogram with the same binning whose values
+            are used as the bin errors instead of the variances of bh_histo.
 
     Returns:
         The converted ROOT histogram. Type depends on dimensionality.
     """
+    if ROOT is None:
+        raise ImportError("PyROOT is required to create ROOT histogram objects")
+
     histo = None
     if len(bh_histo.axes) == 1:
         histo = ROOT.TH1D(name, name, 3, 0, 1)
@@ -78,17 +88,49 @@ def convert_to_root_histo(
     indices_ranges = [list(range(n)) for n in bh_histo.axes.size]
     for indices_tuple in itertools.product(*indices_ranges):
         root_indices = [index + 1 for index in indices_tuple]
+        if bh_error_histo is None:
+            error = math.sqrt(bh_histo[indices_tuple].variance)  # type: ignore
+        else:
+            error = bh_error_histo[indices_tuple].value  # type: ignore
         histo.SetBinContent(
             histo.GetBin(*root_indices), bh_histo[indices_tuple].value  # type: ignore
         )
-        histo.SetBinError(
-            histo.GetBin(*root_indices), math.sqrt(bh_histo[indices_tuple].variance)  # type: ignore # noqa
-        )
+        histo.SetBinError(histo.GetBin(*root_indices), error)
 
     return histo
 
 
+def _to_writable_histo(name: str, bh_histo: bh.Histogram) -> bh.Histogram:
+    """Return a copy of a histogram labelled the way uproot writes TH*D titles.
+
+    uproot takes the histogram title from the `name` attribute and the axis
+    titles from the `label` attributes, while PIDCalib2 keeps the axis names in
+    the axis metadata.
+
+    Args:
+        name: Name (title) of the new ROOT histogram.
+        bh_histo: The histogram to convert.
+    """
+    if len(bh_histo.axes) not in (1, 2, 3):
+        raise Exception(f"{len(bh_histo.axes)}D histograms not supported by ROOT")
+
+    histo = bh_histo.copy()
+    histo.name = name  # type: ignore
+    for axis in histo.axes:
+        axis.label = axis.metadata["name"]  # type: ignore
+    return histo
+
+
 def convert_pklfile_to_rootfile(path: str):
+    """Convert pickled efficiency histograms to TH*D and save them to ROOT.
+
+    The histograms are written with uproot, which serializes the bin contents
+    and errors of each histogram as whole arrays; PyROOT is not needed.
+
+    Args:
+        path: Path to the pickle file with the eff, passing, and total
+            histograms. The ROOT file is saved next to it with a .root suffix.
+    """
     pkl_path = pathlib.Path(path)
     eff_histos = {}
     with open(pkl_path, "rb") as f:
@@ -96,22 +138,13 @@ def convert_pklfile_to_rootfile(path: str):
         eff_histos["passing"] = pickle.load(f)
         eff_histos["total"] = pickle.load(f)
 
-        for item in eff_histos.values():
-            assert isinstance(item, bh.Histogram)
-
-        root_path = pkl_path.with_suffix(".root")
-        root_file = ROOT.TFile(str(root_path), "RECREATE")
-
-        eff_histo = convert_to_root_histo("eff", eff_histos["eff"])
-        eff_histo.Write()
-
-        passing_histo = convert_to_root_histo("passing", eff_histos["passing"])
-        passing_histo.Write()
-
-        total_histo = convert_to_root_histo("total", eff_histos["total"])
-        total_histo.Write()
+    for item in eff_histos.values():
+        assert isinstance(item, bh.Histogram)
 
-        root_file.Close()
+    root_path = pkl_path.with_suffix(".root")
+    with uproot.recreate(root_path) as root_file:
+        for name, histo in eff_histos.items():
+            root_file[name] = _to_writable_histo(name, histo)
 
 
 def main():
@@ -43,8 +43,9 @@ import logzero
 import matplotlib
 import mplhep
 import numpy as np
+import pandas as pd
 from logzero import logger as log
-from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
 from tqdm import tqdm
 
 from . import argparse_actions, binning, pid_data, utils
@@ -238,7 +239,8 @@ def create_plot_histograms(
     """Create histograms for plotting.
 
     A separate set of histograms is created for each file in the calib_sample.
-    The set comprises histograms for each variable in branch_names.
+    The set comprises histograms for each variable in branch_names. The files
+    are read and histogrammed in chunks to limit memory usage.
 
     Args:
         config: A configuration dictionary. See decode_arguments(args) for
@@ -277,28 +279,53 @@ def create_plot_histograms(
 
     all_hists = {}
 
+    # Rename colums of the dataset from branch names to simple user-level
+    # names, e.g., probe_PIDK -> DLLK.
+    inverse_branch_dict = {val: key for key, val in branch_names.items()}
+    branches = list(branch_names.values())
+
     for path in (
         tqdm(calib_sample["files"], leave=False, desc="Processing files")
         if sys.stderr.isatty()  # Use tqdm only when running interactively
         else calib_sample["files"]
     ):
-        df = pid_data.root_to_dataframe(
-            path, tree_paths, list(branch_names.values()), True
-        )
-        if df is not None:
-            # Rename colums of the dataset from branch names to simple user-level
-            # names, e.g., probe_PIDK -> DLLK.
-            inverse_branch_dict = {val: key for key, val in branch_names.items()}
-            df = df.rename(columns=inverse_branch_dict)  # type: ignore
-
-            utils.apply_all_cuts(
-                df,
-                cut_stats,
-                binning_range_cuts,
-                calib_sample["cuts"] if "cuts" in calib_sample else [],
-                config["cuts"] if "cuts" in config else [],
-            )
+        hists: Dict[str, bh.Histogram] = {}
+        # Chunks are buffered only until the missing binnings can be defined
+        # from the first file
+        pending_dfs = []
+        try:
+            for df in pid_data.iterate_root_dataframes(
+                path, tree_paths, branches, True
+            ):
+                df = df.rename(columns=inverse_branch_dict)  # type: ignore
+
+                utils.apply_all_cuts(
+                    df,
+                    cut_stats,
+                    binning_range_cuts,
+                    calib_sample["cuts"] if "cuts" in calib_sample else [],
+                    config["cuts"] if "cuts" in config else [],
+                )
 
+                if bin_vars_without_binnings:
+                    pending_dfs.append(df)
+                else:
+                    hists = fill_plot_histograms(hists, df, config)
+        except OSError as err:
+            if "Operation expired" in err.args[0]:
+                log.error(
+                    (
+                        f"Failed to read '{path}' because an XRootD operation "
+                        "expired; skipping"
+                    )
+                )
+                print(err)
+                continue
+            else:
+                raise
+
+        if pending_dfs:
+            df = pd.concat(pending_dfs)
             # If no binning
             for var in bin_vars_without_binnings:
                 range = df[var].max() - df[var].min()  # type: ignore
@@ -312,11 +339,9 @@ def create_plot_histograms(
             # Empty the list to avoid redefining the binning in each step
             bin_vars_without_binnings = []
 
-            hists = {
-                var: utils.make_hist(df, config["particle"], [var])
-                for var in config["bin_vars"]
-            }
+            hists = fill_plot_histograms(hists, df, config)
 
+        if hists:
             all_hists[path] = hists
 
     log.info(f"Processed {len(all_hists)}/{len(calib_sample['files'])} files")
@@ -325,6 +350,29 @@ def create_plot_histograms(
     return all_hists
 
 
+def fill_plot_histograms(
+    hists: Dict[str, bh.Histogram], df: pd.DataFrame, config: Dict
+) -> Dict[str, bh.Histogram]:
+    """Add events from a DataFrame to the plotting histograms.
+
+    Args:
+        hists: A dictionary {var: histogram} to add to. Can be empty.
+        df: DataFrame with the events to histogram.
+        config: A configuration dictionary. See decode_arguments(args) for
+            details.
+
+    Returns:
+        A dictionary {var: histogram} with the events from df included.
+    """
+    new_hists = {
+        var: utils.make_hist(df, config["particle"], [var])
+        for var in config["bin_vars"]
+    }
+    if not hists:
+        return new_hists
+    return utils.add_hists([hists, new_hists])
+
+
 def save_plots(
     total_hists: Dict[str, bh.Histogram], output_dir: pathlib.Path, format: str
 ) -> None:
@@ -342,20 +390,23 @@ def save_plots(
         # Fallback to old mplhep style setting
         mplhep.set_style("LHCb2")
 
+    # Figures are created directly instead of through pyplot so that no global
+    # figure registry has to be maintained and cleaned up
     for var, hist in total_hists.items():
-        plt.hist(
+        fig = Figure()
+        ax = fig.subplots()
+        ax.hist(
             hist.axes[0].edges[:-1],
             bins=hist.axes[0].edges,
             weights=hist.values(),
             histtype="step",
         )
-        plt.ylabel("Events")
-        plt.xlabel(var)
-        plt.tight_layout()
+        ax.set_ylabel("Events")
+        ax.set_xlabel(var)
+        fig.tight_layout()
         path = output_dir / pathlib.Path(var + "." + format)
         log.info(f"Saving plot {path}")
-        plt.savefig(path, dpi=100)
-        plt.close()
+        fig.savefig(path, dpi=100)
 
 
 def save_histograms(
@@ -54,15 +54,19 @@ Examples:
 import argparse
 import ast
 import logging
+import math
 import pathlib
 import sys
 import time
-from typing import Dict
+from typing import Dict, Iterator, List
 
+import boost_histogram as bh
 import logzero
+import numpy as np
+import pandas as pd
 from logzero import logger as log
 
-from . import argparse_actions, merge_trees, pid_data, utils
+from . import argparse_actions, pid_data, utils
 
 try:
     from .version import version  # type: ignore
@@ -210,37 +214,46 @@ def ref_calib(config: Dict) -> float:
         config["histo_dir"], config["sample"], config["magnet"], ref_pars, bin_vars
     )
 
-    log.info(f"Loading reference sample '{config['ref_file']}' ...")
+    log.info(f"Processing reference sample '{config['ref_file']}' ...")
     ref_branches = pid_data.get_reference_branch_names(ref_pars, bin_vars)
-    df_ref = pid_data.root_to_dataframe(
-        config["ref_file"], [config["ref_tree"]], ref_branches
+
+    output_path = pathlib.Path(config["output_file"])
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # The reference sample is processed and saved in chunks so that it never
+    # has to be held in memory in its entirety
+    eff_stats = {"events": 0, "outside range": 0, "valid": 0, "sum": 0.0, "time": 0.0}
+    pid_data.save_dataframes_as_root(
+        add_efficiencies_in_chunks(
+            config, ref_pars, bin_vars, eff_histos, ref_branches, eff_stats
+        ),
+        "PIDCalibTree",
+        str(output_path),
     )
     log.debug(
-        f"Reference sample '{config['ref_file']}' with {len(df_ref.index)} events loaded"  # noqa
+        f"Reference sample '{config['ref_file']}' with {eff_stats['events']} events processed"  # noqa
     )
-
-    start = time.perf_counter()
-    df_ref = utils.add_bin_indices(df_ref, list(ref_pars), bin_vars, eff_histos)
-    df_ref = utils.add_efficiencies(df_ref, list(ref_pars), eff_histos)
-    end = time.perf_counter()
-    log.debug(f"Efficiency calculation took {end-start:.2f}s")
+    log.debug(f"Efficiency calculation took {eff_stats['time']:.2f}s")
+
+    if eff_stats["events"]:
+        num_outside_range_frac = eff_stats["outside range"] / eff_stats["events"]
+        log.warning(
+            (
+                "Events out of binning range: "
+                f"{eff_stats['outside range']} ({num_outside_range_frac:.2%})"
+            )
+        )
 
     # Calculate average of the per-event effs
     # Use only data with valid eff values (those events falling inside the
     # calibration hist)
-    avg_eff = df_ref["PIDCalibEff"].dropna().mean()
+    avg_eff = eff_stats["sum"] / eff_stats["valid"] if eff_stats["valid"] else math.nan
     log.info(f"Average per-event PID efficiency: {avg_eff:.2%}")
 
-    output_path = pathlib.Path(config["output_file"])
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-
-    pid_data.save_dataframe_as_root(
-        df_ref[[key for key in df_ref.keys() if key not in ref_branches]],
-        "PIDCalibTree",
-        str(output_path),
-    )
-
     if config["merge"]:
+        # Imported here because merging requires PyROOT, which is optional
+        from . import merge_trees
+
         merge_trees.copy_tree_and_set_as_friend(
             str(output_path), "PIDCalibTree", config["ref_file"], config["ref_tree"]
         )
@@ -248,6 +261,56 @@ def ref_calib(config: Dict) -> float:
     return avg_eff  # type: ignore
 
 
+def add_efficiencies_in_chunks(
+    config: Dict,
+    ref_pars: Dict,
+    bin_vars: Dict[str, str],
+    eff_histos: Dict[str, Dict[str, bh.Histogram]],
+    ref_branches: List[str],
+    eff_stats: Dict[str, float],
+) -> Iterator[pd.DataFrame]:
+    """Yield chunks of bin indices and efficiencies of the reference sample.
+
+    Only the newly calculated columns are yielded; the branches read from the
+    reference sample are not included. Running totals needed to report on the
+    whole sample are accumulated in eff_stats.
+
+    Args:
+        config: A configuration dictionary. See decode_arguments(args) for
+            details.
+        ref_pars: Particle prefixes with their particle types and PID cuts.
+        bin_vars: Variables used for binning.
+        eff_histos: Efficiency histograms for each prefix/particle.
+        ref_branches: Branches to be read from the reference sample.
+        eff_stats: Running totals of the events processed, events outside the
+            binning, valid efficiencies, their sum, and the time spent.
+    """
+    # The lookup tables are built once and shared by all the chunks
+    tables = utils.get_efficiency_tables(eff_histos, list(ref_pars))
+    for arrays in pid_data.iterate_root_arrays(
+        config["ref_file"], [config["ref_tree"]], ref_branches
+    ):
+        # The columns are kept as bare NumPy arrays; a DataFrame is only built
+        # from the new columns for saving
+        start = time.perf_counter()
+        bin_indices = utils.calculate_bin_indices(
+            arrays, list(ref_pars), bin_vars, eff_histos
+        )
+        efficiencies = utils.calculate_efficiencies(
+            {**arrays, **bin_indices}, list(ref_pars), eff_histos, tables=tables
+        )
+        eff_stats["time"] += time.perf_counter() - start
+
+        effs = efficiencies["PIDCalibEff"]
+        num_valid = len(effs) - np.count_nonzero(np.isnan(effs))
+        eff_stats["events"] += len(effs)
+        eff_stats["outside range"] += len(effs) - num_valid
+        eff_stats["valid"] += num_valid
+        eff_stats["sum"] += np.nansum(effs)
+
+        yield pd.DataFrame({**bin_indices, **efficiencies})
+
+
 def main():
     config = vars(decode_arguments(sys.argv[1:]))
     ref_calib(config)
@@ -1,3 +1,13 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pidcalib2 import utils
+
+
 def pytest_configure(config):
     config.addinivalue_line(
         "markers",
@@ -9,3 +19,81 @@ def pytest_configure(config):
     config.addinivalue_line(
         "markers", "pyroot: tests requiring PyROOT (deselect with '-m \"not pyroot\"')"
     )
+    config.addinivalue_line(
+        "markers", "xdist_group(name): run tests of a group on the same xdist worker"
+    )
+
+
+def pytest_collection_modifyitems(items):
+    # Keep tests reading from EOS on a single worker with 'pytest-xdist
+    # --dist loadgroup', so the other workers are free for local tests
+    for item in items:
+        if item.get_closest_marker("xrootd"):
+            item.add_marker(pytest.mark.xdist_group("xrootd"))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def warm_up_numba_kernels():
+    """Compile (or load from cache) the Numba kernels before the first test.
+
+    This keeps the JIT compilation time out of the durations of individual
+    tests. Nothing is done when Numba is not installed.
+    """
+    if utils.numba is None:
+        return
+    # Kernels are specialized for each input dtype; cover the common ones for
+    # both generic and integer binnings
+    for dtype in [np.float64, np.float32, np.int64, np.int32]:
+        values = np.array([0, 2], dtype=dtype)
+        utils.get_bin_indices(values, np.array([0.0, 1.0, 3.0]))
+        utils.get_bin_indices(values, np.array([0.0, 1.0, 2.0, 3.0]))
+    utils.combine_track_efficiencies(np.ones((1, 1)), np.zeros((1, 1)))
+
+
+@pytest.fixture(scope="session")
+def test_path():
+    return Path(__file__).resolve().parent
+
+
+@pytest.fixture(scope="session")
+def cal_test_df(test_path):
+    """Return cal_test_data.csv parsed once per session; copy before modifying."""
+    return pd.read_csv(test_path / "test_data/cal_test_data.csv", index_col=0)
+
+
+@pytest.fixture(scope="session")
+def ref_test_df(test_path):
+    """Return ref_test_data.csv parsed once per session; copy before modifying."""
+    return pd.read_csv(test_path / "test_data/ref_test_data.csv", index_col=0)
+
+
+@pytest.fixture(scope="session")
+def cal_test_data_pkl(cal_test_df, tmp_path_factory):
+    """Return the path to a pickled copy of cal_test_data.csv.
+
+    Tests that don't exercise the CSV reader itself can load the much faster
+    pickle instead.
+    """
+    path = tmp_path_factory.mktemp("cal_test_data") / "cal_test_data.pkl"
+    cal_test_df.to_pickle(path)
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def load_eff_hists(test_path):
+    """Return a function loading efficiency histograms from test_data.
+
+    Each file is unpickled only once per session. The histograms are shared
+    between tests and must not be modified.
+    """
+    cache = {}
+
+    def load(filename):
+        if filename not in cache:
+            with open(test_path / "test_data" / filename, "rb") as f:
+                cache[filename] = {
+                    name: pickle.load(f) for name in ["eff", "passing", "total"]
+                }
+        return cache[filename]
+
+    return load
@@ -11,8 +11,6 @@
 
 import copy
 import math
-import os
-from pathlib import Path
 
 import pandas as pd
 import pytest
@@ -20,13 +18,7 @@ import pytest
 from pidcalib2 import binning, make_eff_hists
 
 
-@pytest.fixture
-def test_path():
-    return Path(os.path.dirname(os.path.abspath(__file__)))
-
-
-@pytest.fixture
-def config():
+def default_config():
     return {
         "bin_vars": None,
         "binning_file": None,
@@ -44,41 +36,55 @@ def config():
     }
 
 
-def test_make_eff_hists(config, test_path, tmp_path):
+@pytest.fixture
+def config():
+    return default_config()
+
+
+@pytest.fixture(scope="module")
+def eff_histo_reference(test_path):
+    return pd.read_pickle(test_path / "test_data/effhists-Turbo18-up-pi-DLLK<4-P.pkl")
+
+
+@pytest.fixture(scope="module")
+def baseline_eff_histo(test_path, tmp_path_factory):
+    """Run make_eff_hists once with the baseline configuration."""
+    output_dir = tmp_path_factory.mktemp("test_output")
+    config = default_config()
     config.update(
         {
             "bin_vars": ["P"],
             "local_dataframe": str(test_path / "test_data/cal_test_data.csv"),
             "magnet": "up",
-            "output_dir": str(tmp_path / "test_output"),
+            "output_dir": str(output_dir),
             "particle": "Pi",
             "pid_cuts": ["DLLK < 4", "DLLK<3"],
             "sample": "Turbo18",
         }
     )
     make_eff_hists.make_eff_hists(config)
-    eff_histo = pd.read_pickle(
-        tmp_path / "test_output/effhists-Turbo18-up-Pi-DLLK<4-P.pkl"
-    )
+    return pd.read_pickle(output_dir / "effhists-Turbo18-up-Pi-DLLK<4-P.pkl")
 
+
+def assert_baseline_eff_histo(eff_histo):
     # These asserts might come in handy when some detail in the boost_histogram
     # implementation changes, thus failing the reference histogram comparison.
     assert eff_histo.sum(flow=False).value == pytest.approx(17.812484216412948)
     assert eff_histo.sum(flow=True).value == pytest.approx(23.57053953265155)
     assert eff_histo[1].value == 0.8978157343833105
 
-    eff_histo_reference = pd.read_pickle(
-        test_path / "test_data/effhists-Turbo18-up-pi-DLLK<4-P.pkl"
-    )
-    assert eff_histo == eff_histo_reference
 
+def test_make_eff_hists(baseline_eff_histo, eff_histo_reference):
+    assert_baseline_eff_histo(baseline_eff_histo)
+    assert baseline_eff_histo == eff_histo_reference
 
-def test_make_eff_hists_with_user_cuts(config, test_path, tmp_path):
+
+@pytest.fixture
+def user_cuts_config(config, tmp_path, cal_test_data_pkl):
     config.update(
         {
             "bin_vars": ["P"],
-            "cuts": ["Dst_IPCHI2 < 100", "probe_TRACK_GHOSTPROB < 0.05"],
-            "local_dataframe": str(test_path / "test_data/cal_test_data.csv"),
+            "local_dataframe": cal_test_data_pkl,
             "magnet": "up",
             "output_dir": str(tmp_path / "test_output"),
             "particle": "Pi",
@@ -86,25 +92,27 @@ def test_make_eff_hists_with_user_cuts(config, test_path, tmp_path):
             "sample": "Turbo18",
         }
     )
-    make_eff_hists.make_eff_hists(config)
+    return config
+
+
+def test_make_eff_hists_with_user_cuts(user_cuts_config, tmp_path, eff_histo_reference):
+    user_cuts_config["cuts"] = ["Dst_IPCHI2 < 100", "probe_TRACK_GHOSTPROB < 0.05"]
+    make_eff_hists.make_eff_hists(user_cuts_config)
     eff_histo = pd.read_pickle(
         tmp_path / "test_output/effhists-Turbo18-up-Pi-DLLK<4-P.pkl"
     )
 
-    # These asserts might come in handy when some detail in the boost_histogram
-    # implementation changes, thus failing the reference histogram comparison.
-    assert eff_histo.sum(flow=False).value == pytest.approx(17.812484216412948)
-    assert eff_histo.sum(flow=True).value == pytest.approx(23.57053953265155)
-    assert eff_histo[1].value == 0.8978157343833105
+    assert_baseline_eff_histo(eff_histo)
 
-    eff_histo_reference = pd.read_pickle(
-        test_path / "test_data/effhists-Turbo18-up-pi-DLLK<4-P.pkl"
-    )
     assert eff_histo == eff_histo_reference
 
+
+def test_make_eff_hists_with_strict_user_cuts(
+    user_cuts_config, tmp_path, eff_histo_reference
+):
     # Test that stricter cuts have an effect
-    config["cuts"] = ["Dst_IPCHI2 < 9", "probe_TRACK_GHOSTPROB < 0.01"]
-    make_eff_hists.make_eff_hists(config)
+    user_cuts_config["cuts"] = ["Dst_IPCHI2 < 9", "probe_TRACK_GHOSTPROB < 0.01"]
+    make_eff_hists.make_eff_hists(user_cuts_config)
     eff_histo = pd.read_pickle(
         tmp_path / "test_output/effhists-Turbo18-up-Pi-DLLK<4-P.pkl"
     )
@@ -194,7 +202,7 @@ def test_make_eff_hists_file_list(config, test_path, tmp_path):
     assert eff_histo[1].value == 0.9797018332573063
 
 
-def test_decode_arguments(capsys, test_path, tmp_path):
+def test_decode_arguments():
     assert (
         make_eff_hists.decode_arguments(
             [
@@ -208,16 +216,20 @@ def test_decode_arguments(capsys, test_path, tmp_path):
         is False
     )
 
-    with pytest.raises(SystemExit):
-        make_eff_hists.decode_arguments(
-            ["-m=up", "--particle=K", "--pid-cut='DLLK>5'", "--bin-var=P"]
-        )
 
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["-m=up", "--particle=K", "--pid-cut='DLLK>5'", "--bin-var=P"],
+        ["--sample=Turbo18", "-m=up", "--particle=K", "--bin-var=P"],
+    ],
+)
+def test_decode_arguments_missing_required(args):
     with pytest.raises(SystemExit):
-        make_eff_hists.decode_arguments(
-            ["--sample=Turbo18", "-m=up", "--particle=K", "--bin-var=P"]
-        )
+        make_eff_hists.decode_arguments(args)
+
 
+def test_decode_arguments_list(capsys, test_path):
     with pytest.raises(SystemExit):
         make_eff_hists.decode_arguments(
             ["--list", str(test_path / "test_data/test_samples.json")]
@@ -230,15 +242,17 @@ def test_decode_arguments(capsys, test_path, tmp_path):
     )
 
 
-def test_make_eff_hists_with_custom_binning(config, test_path, tmp_path):
-    # Save the original binnings so we can restore them later
-    orig_binnings = copy.deepcopy(binning.binnings)
+def test_make_eff_hists_with_custom_binning(
+    config, test_path, tmp_path, cal_test_data_pkl, monkeypatch
+):
+    # Custom binnings must not leak into other tests
+    monkeypatch.setattr(binning, "binnings", copy.deepcopy(binning.binnings))
 
     config.update(
         {
             "bin_vars": ["P"],
             "binning_file": str(test_path / "test_data/custom_binning.json"),
-            "local_dataframe": str(test_path / "test_data/cal_test_data.csv"),
+            "local_dataframe": cal_test_data_pkl,
             "magnet": "up",
             "output_dir": str(tmp_path / "test_output"),
             "particle": "Pi",
@@ -257,6 +271,3 @@ def test_make_eff_hists_with_custom_binning(config, test_path, tmp_path):
     assert eff_histo.sum(flow=False).value == pytest.approx(1.8099485065453211)
     assert eff_histo.sum(flow=True).value == pytest.approx(41.404466293590865)
     assert eff_histo[1].value == 0.9625150986552666
-
-    # Restore original binnings for other tests
-    binning.binnings = orig_binnings
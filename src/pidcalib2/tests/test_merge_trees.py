@@ -9,56 +9,54 @@
 # or submit itself to any jurisdiction.                                       #
 ###############################################################################
 
-import os
-import shutil
-from pathlib import Path
 
 import pytest
-import ROOT
 
-from pidcalib2 import merge_trees
+# Skip the whole module if PyROOT is unavailable (merge_trees needs it too)
+ROOT = pytest.importorskip("ROOT")
 
+from pidcalib2 import merge_trees  # noqa: E402
 
-@pytest.fixture
-def test_path():
-    return Path(os.path.dirname(os.path.abspath(__file__)))
+pytestmark = pytest.mark.pyroot
 
 
-@pytest.mark.pyroot
-def test_copy_tree(test_path, tmp_path):
-    shutil.copy(
-        test_path / "test_data/ref_test_data.root",
-        tmp_path / "ref_test_data_copy.root",
-    )
+@pytest.fixture(scope="module")
+def ref_test_data_bytes(test_path):
+    return (test_path / "test_data/ref_test_data.root").read_bytes()
+
+
+@pytest.fixture
+def ref_test_data_copy(ref_test_data_bytes, tmp_path):
+    """Return the path to a fresh copy of ref_test_data.root in tmp_path."""
+    path = tmp_path / "ref_test_data_copy.root"
+    path.write_bytes(ref_test_data_bytes)
+    return path
 
+
+def test_copy_tree(test_path, ref_test_data_copy):
     merge_trees.copy_tree_and_set_as_friend(
         str(test_path / "test_data/ref_PID_eff.root"),
         "PID_eff_tree",
-        str(tmp_path / "ref_test_data_copy.root"),
+        str(ref_test_data_copy),
         "DecayTree",
     )
 
-    new_file = ROOT.TFile(str(tmp_path / "ref_test_data_copy.root"))
+    new_file = ROOT.TFile(str(ref_test_data_copy))
     new_tree = new_file.Get("DecayTree")
 
     assert new_tree.GetEntry(0) == 84
     assert new_tree.PID_eff == pytest.approx(0.9933816230604905)
 
 
-@pytest.mark.pyroot
-def test_copy_tree_bad_filenames(test_path, tmp_path):
-    shutil.copy(
-        test_path / "test_data/ref_test_data.root",
-        tmp_path / "ref_test_data_copy.root",
-    )
+def test_copy_tree_bad_filenames(test_path, tmp_path, ref_test_data_copy):
     # It seems some versions of pyroot raise OSError when a file that should be
     # opened doesn't exist, while others don't and we catch the issue later,
     # raising a SystemExit
     with pytest.raises((OSError, SystemExit)):
         merge_trees.copy_tree_and_set_as_friend(
-            str(test_path / "test_data/x.root"),
+            str(tmp_path / "nonexistent.root"),
             "PID_eff_tree",
-            str(tmp_path / "ref_test_data_copy.root"),
+            str(ref_test_data_copy),
             "DecayTree",
         )
 
@@ -66,23 +64,17 @@ def test_copy_tree_bad_filenames(test_path, tmp_path):
         merge_trees.copy_tree_and_set_as_friend(
             str(test_path / "test_data/ref_PID_eff.root"),
             "PID_eff_tree",
-            str(test_path / "test_data/x.root"),
+            str(tmp_path / "nonexistent.root"),
             "DecayTree",
         )
 
 
-@pytest.mark.pyroot
-def test_copy_tree_bad_treenames(test_path, tmp_path):
-    shutil.copy(
-        test_path / "test_data/ref_test_data.root",
-        tmp_path / "ref_test_data_copy.root",
-    )
-
+def test_copy_tree_bad_treenames(test_path, ref_test_data_copy):
     with pytest.raises(SystemExit):
         merge_trees.copy_tree_and_set_as_friend(
             str(test_path / "test_data/ref_PID_eff.root"),
             "x",
-            str(tmp_path / "ref_test_data_copy.root"),
+            str(ref_test_data_copy),
             "DecayTree",
         )
 
@@ -90,6 +82,6 @@ def test_copy_tree_bad_treenames(test_path, tmp_path):
         merge_trees.copy_tree_and_set_as_friend(
             str(test_path / "test_data/ref_PID_eff.root"),
             "PID_eff_tree",
-            str(tmp_path / "ref_test_data_copy.root"),
+            str(ref_test_data_copy),
             "x",
         )
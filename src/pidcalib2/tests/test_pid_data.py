@@ -10,17 +10,22 @@
 ###############################################################################
 
 import math
-import os
-from pathlib import Path
 
+import numpy as np
+import pandas as pd
 import pytest
 
 from pidcalib2 import pid_data
 
 
-@pytest.fixture
-def test_path():
-    return Path(os.path.dirname(os.path.abspath(__file__)))
+@pytest.fixture(scope="module")
+def samples_path(test_path):
+    return str(test_path / "../data/samples.json")
+
+
+@pytest.fixture(scope="module")
+def samples_dict(samples_path):
+    return pid_data.get_calibration_samples(samples_path)
 
 
 @pytest.mark.xrootd
@@ -36,51 +41,92 @@ def test_root_to_dataframe():
     )
 
 
-def test_get_tree_paths():
-    assert pid_data.get_tree_paths("Pi", "26") == ["DecayTree"]
-    assert pid_data.get_tree_paths("Pi", "Turbo15") == [
-        "DSt_PiMTuple/DecayTree",
-        "DSt_PiPTuple/DecayTree",
-    ]
-    assert pid_data.get_tree_paths("Mu", "Turbo15-MagUp-Mu") == [
-        "Jpsi_MuPTuple/DecayTree",
-        "Jpsi_MuMTuple/DecayTree",
-    ]
-
-
-def test_get_relevant_branch_names():
-    assert pid_data.get_relevant_branch_names(["DLLK < 4"], ["P"]) == {
-        "sWeight": "probe_sWeight",
-        "P": "probe_P",
-        "DLLK": "probe_PIDK",
-    }
-
-    assert pid_data.get_relevant_branch_names(["DLLp > 4"], ["P", "ETA"]) == {
-        "sWeight": "probe_sWeight",
-        "P": "probe_P",
-        "ETA": "probe_ETA",
-        "DLLp": "probe_PIDp",
-    }
-
-    assert pid_data.get_relevant_branch_names(["DLLp == 4"], ["P", "ETA"]) == {
-        "sWeight": "probe_sWeight",
-        "P": "probe_P",
-        "ETA": "probe_ETA",
-        "DLLp": "probe_PIDp",
-    }
-
-    assert pid_data.get_relevant_branch_names(["DLLp != 4"], ["P", "ETA"]) == {
-        "sWeight": "probe_sWeight",
-        "P": "probe_P",
-        "ETA": "probe_ETA",
-        "DLLp": "probe_PIDp",
-    }
-
-    assert pid_data.get_relevant_branch_names(["test_DLL != 4"], ["special_var"]) == {
-        "sWeight": "probe_sWeight",
-        "test_DLL": "test_DLL",
-        "special_var": "special_var",
-    }
+def test_iterate_root_dataframes(test_path):
+    path = str(test_path / "test_data/ref_test_data.root")
+    dfs = list(
+        pid_data.iterate_root_dataframes(
+            path, ["DecayTree"], ["Bach_P", "nTracks"], step_size=30
+        )
+    )
+    assert [df.shape[0] for df in dfs] == [30, 30, 30, 10]
+
+    df = pid_data.root_to_dataframe(path, ["DecayTree"], ["Bach_P", "nTracks"])
+    pd.testing.assert_frame_equal(pd.concat(dfs, ignore_index=True), df)
+
+    df = pid_data.root_to_dataframe(
+        path, ["DecayTree"], ["Bach_P", "nTracks"], float32=True
+    )
+    assert df["Bach_P"].dtype == "float32"
+    assert df["nTracks"].dtype != "float64"
+
+
+@pytest.mark.parametrize(
+    "particle,sample,expected",
+    [
+        ("Pi", "26", ["DecayTree"]),
+        ("Pi", "Turbo15", ["DSt_PiMTuple/DecayTree", "DSt_PiPTuple/DecayTree"]),
+        (
+            "Mu",
+            "Turbo15-MagUp-Mu",
+            ["Jpsi_MuPTuple/DecayTree", "Jpsi_MuMTuple/DecayTree"],
+        ),
+    ],
+)
+def test_get_tree_paths(particle, sample, expected):
+    assert pid_data.get_tree_paths(particle, sample) == expected
+
+
+@pytest.mark.parametrize(
+    "pid_cuts,bin_vars,expected",
+    [
+        (
+            ["DLLK < 4"],
+            ["P"],
+            {"sWeight": "probe_sWeight", "P": "probe_P", "DLLK": "probe_PIDK"},
+        ),
+        (
+            ["DLLp > 4"],
+            ["P", "ETA"],
+            {
+                "sWeight": "probe_sWeight",
+                "P": "probe_P",
+                "ETA": "probe_ETA",
+                "DLLp": "probe_PIDp",
+            },
+        ),
+        (
+            ["DLLp == 4"],
+            ["P", "ETA"],
+            {
+                "sWeight": "probe_sWeight",
+                "P": "probe_P",
+                "ETA": "probe_ETA",
+                "DLLp": "probe_PIDp",
+            },
+        ),
+        (
+            ["DLLp != 4"],
+            ["P", "ETA"],
+            {
+                "sWeight": "probe_sWeight",
+                "P": "probe_P",
+                "ETA": "probe_ETA",
+                "DLLp": "probe_PIDp",
+            },
+        ),
+        (
+            ["test_DLL != 4"],
+            ["special_var"],
+            {
+                "sWeight": "probe_sWeight",
+                "test_DLL": "test_DLL",
+                "special_var": "special_var",
+            },
+        ),
+    ],
+)
+def test_get_relevant_branch_names(pid_cuts, bin_vars, expected):
+    assert pid_data.get_relevant_branch_names(pid_cuts, bin_vars) == expected
 
 
 def test_dataframe_from_local_file(test_path):
@@ -108,6 +154,27 @@ def test_dataframe_from_local_file(test_path):
         )
 
 
+def test_dataframe_from_local_file_columnar(cal_test_df, tmp_path):
+    pytest.importorskip("pyarrow")
+    df = cal_test_df
+    df.to_parquet(tmp_path / "cal_test_data.parquet")
+    df.reset_index(drop=True).to_feather(tmp_path / "cal_test_data.feather")
+
+    for suffix in ["parquet", "feather"]:
+        df_columnar = pid_data.dataframe_from_local_file(
+            str(tmp_path / f"cal_test_data.{suffix}"), ["sWeight"]
+        )
+        assert list(df_columnar.columns) == ["sWeight"]
+        assert df_columnar.shape[0] == 99
+        assert df_columnar["sWeight"][0] == pytest.approx(1.1081801082842266)
+
+        with pytest.raises(KeyError):
+            pid_data.dataframe_from_local_file(
+                str(tmp_path / f"cal_test_data.{suffix}"),
+                ["this key doesn't exist"],
+            )
+
+
 def test_get_reference_branch_names():
     ref_pars = {"Bach": ["K", "DLLK > 4"]}
     bin_vars = {"P": "P", "ETA": "ETA", "nTracks": "nTracks"}
@@ -124,81 +191,92 @@ def test_get_reference_branch_name():
     )
 
 
-def test_get_calib_hists(test_path):
+@pytest.fixture(scope="module")
+def calib_hists_bach(test_path):
     ref_pars = {"Bach": ["K", "DLLK > 4"]}
     bin_vars = {"P": "P", "ETA": "ETA", "nTracks": "nTracks"}
-    eff_hists = pid_data.get_calib_hists(
+    return pid_data.get_calib_hists(
         str(test_path / "test_data"), "Turbo18", "up", ref_pars, bin_vars
-    )
-    assert math.isnan(eff_hists["Bach"]["eff"].sum().value)  # type: ignore
-    assert eff_hists["Bach"]["eff"][4, 2, 1].value == pytest.approx(  # type: ignore
+    )["Bach"]
+
+
+def test_get_calib_hists(calib_hists_bach):
+    assert math.isnan(calib_hists_bach["eff"].sum().value)  # type: ignore
+    assert calib_hists_bach["eff"][4, 2, 1].value == pytest.approx(  # type: ignore
         0.9759721725381351
     )
-    assert eff_hists["Bach"]["passing"].sum().value == pytest.approx(  # type: ignore
+    assert calib_hists_bach["passing"].sum().value == pytest.approx(  # type: ignore
         77882.51311058077
     )
-    assert eff_hists["Bach"]["total"].sum().value == pytest.approx(  # type: ignore
+    assert calib_hists_bach["total"].sum().value == pytest.approx(  # type: ignore
         86103.98549868543
     )
-    assert eff_hists["Bach"]["passing"].sum().variance == pytest.approx(  # type: ignore
+    assert calib_hists_bach["passing"].sum().variance == pytest.approx(  # type: ignore
         97895.25547125406
     )
-    assert eff_hists["Bach"]["total"].sum().variance == pytest.approx(  # type: ignore
+    assert calib_hists_bach["total"].sum().variance == pytest.approx(  # type: ignore
         111911.08518551107
     )
 
+
+def test_get_calib_hists_missing(test_path):
     with pytest.raises(FileNotFoundError):
         pid_data.get_calib_hists(
             str(test_path / "test_data"),
             "Turbo34",
             "up",
-            ref_pars,
-            bin_vars,
+            {"Bach": ["K", "DLLK > 4"]},
+            {"P": "P", "ETA": "ETA", "nTracks": "nTracks"},
         )
 
 
-def test_get_calibration_sample(test_path):
-    assert (
-        len(
-            pid_data.get_calibration_sample(
-                "Turbo18", "up", "Pi", str(test_path / "../data/samples.json")
-            )["files"]
-        )
-        == 428
-    )
-    assert (
-        len(
-            pid_data.get_calibration_sample(
-                "Turbo18",
-                "up",
-                "Pi",
-                str(test_path / "../data/samples.json"),
-                3,
-            )["files"]
-        )
-        == 3
+@pytest.mark.parametrize(
+    "sample,magnet,particle,max_files,expected",
+    [
+        ("Turbo18", "up", "Pi", None, 428),
+        ("Turbo18", "up", "Pi", 3, 3),
+        ("Electron18", "down", "e_B_Jpsi", None, 1),
+        ("20", "down", "K", None, 72),
+    ],
+)
+def test_get_calibration_sample(
+    samples_dict, sample, magnet, particle, max_files, expected
+):
+    calibration_sample = pid_data.get_calibration_sample_from_dict(
+        samples_dict, sample, magnet, particle, max_files
     )
-    assert (
-        len(
-            pid_data.get_calibration_sample(
-                "Electron18",
-                "down",
-                "e_B_Jpsi",
-                str(test_path / "../data/samples.json"),
-            )["files"]
-        )
-        == 1
+    assert len(calibration_sample["files"]) == expected
+
+
+def test_get_calibration_sample_missing(samples_path):
+    with pytest.raises(KeyError):
+        pid_data.get_calibration_sample("Turbo34", "up", "Pi", samples_path)
+
+
+def test_get_calibration_sample_is_independent(samples_path):
+    calibration_sample = pid_data.get_calibration_sample(
+        "Turbo16", "down", "K", samples_path
     )
-    assert (
-        len(
-            pid_data.get_calibration_sample(
-                "20", "down", "K", str(test_path / "../data/samples.json")
-            )["files"]
-        )
-        == 72
+    num_files = len(calibration_sample["files"])
+    calibration_sample["files"].clear()
+
+    calibration_sample = pid_data.get_calibration_sample(
+        "Turbo16", "down", "K", samples_path
     )
+    assert len(calibration_sample["files"]) == num_files > 0
 
-    with pytest.raises(KeyError):
-        pid_data.get_calibration_sample(
-            "Turbo34", "up", "Pi", str(test_path / "../data/samples.json")
-        )
+
+def test_save_dataframe_as_root(tmp_path):
+    df = pd.DataFrame({"eff": [0.5, np.nan, 0.9], "nTracks": [10, 20, 30]})
+    path = str(tmp_path / "effs.root")
+    pid_data.save_dataframe_as_root(df, "PIDCalibTree", path)
+
+    df_saved = pid_data.root_to_dataframe(path, ["PIDCalibTree"], ["eff", "nTracks"])
+    assert df_saved["eff"].tolist() == [0.5, -999, 0.9]
+    assert df_saved["nTracks"].tolist() == [10, 20, 30]
+    # The input DataFrame must not be modified
+    assert df["eff"].isna().sum() == 1
+
+    pid_data.save_dataframe_as_root(df, "PIDCalibTree", path, ["eff"], chunk_size=2)
+    df_saved = pid_data.root_to_dataframe(path, ["PIDCalibTree"], ["eff"])
+    assert df_saved["eff"].tolist() == [0.5, -999, 0.9]
@@ -10,10 +10,7 @@
 ###############################################################################
 
 import math
-import os
 import pickle
-import shutil
-from pathlib import Path
 
 import pytest
 import uproot
@@ -21,17 +18,11 @@ import uproot
 from pidcalib2 import pklhisto2root
 
 
-@pytest.fixture
-def test_path():
-    return Path(os.path.dirname(os.path.abspath(__file__)))
-
-
 def test_pklhisto2root(test_path, tmp_path):
-    shutil.copy(
-        test_path / "test_data/effhists-Turbo18-up-K-DLLK>0-P.pkl",
-        tmp_path / "effhists-Turbo18-up-K-DLLK>0-P.pkl",
-    )
     pkl_path = tmp_path / "effhists-Turbo18-up-K-DLLK>0-P.pkl"
+    pkl_path.write_bytes(
+        (test_path / "test_data/effhists-Turbo18-up-K-DLLK>0-P.pkl").read_bytes()
+    )
     root_path = tmp_path / "effhists-Turbo18-up-K-DLLK>0-P.root"
     pklhisto2root.convert_pklfile_to_rootfile(pkl_path)
     names = ["eff", "passing", "total"]
@@ -50,3 +41,4 @@ def test_pklhisto2root(test_path, tmp_path):
         assert root_file[name].errors()[0] == pytest.approx(  # type: ignore
             math.sqrt(boost_hists[name].variances()[0])
         )
+        assert root_file[name].axis(0).member("fTitle") == "P"
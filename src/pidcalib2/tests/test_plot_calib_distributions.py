@@ -9,11 +9,13 @@
 # or submit itself to any jurisdiction.                                       #
 ###############################################################################
 
+import copy
 import pickle
 
 import boost_histogram as bh
 import numpy as np
 import pytest
+import uproot
 
 from pidcalib2 import binning, plot_calib_distributions
 
@@ -79,6 +81,29 @@ def test_create_plot_histograms():
     )
 
 
+def test_create_plot_histograms_local(monkeypatch, tmp_path):
+    # Uniform binnings defined on the fly must not leak into other tests
+    monkeypatch.setattr(binning, "binnings", copy.deepcopy(binning.binnings))
+
+    rng = np.random.default_rng(42)
+    path = str(tmp_path / "calib.root")
+    with uproot.recreate(path) as f:
+        f["DecayTree"] = {
+            "probe_PIDK": rng.normal(0, 10, 1000),
+            "probe_sWeight": np.full(1000, 0.5),
+        }
+    config = {"particle": "K", "bin_vars": ["DLLK"], "bins": 50, "cuts": None}
+    calib_sample = {"files": [path]}
+    branch_names = {"sWeight": "probe_sWeight", "DLLK": "probe_PIDK"}
+
+    hists = plot_calib_distributions.create_plot_histograms(
+        config, calib_sample, ["DecayTree"], branch_names
+    )
+
+    assert hists[path]["DLLK"].axes[0].size == 50
+    assert hists[path]["DLLK"].sum(flow=False).value == pytest.approx(500)
+
+
 def test_save_plots(tmp_path):
     hists = {}
     data = np.random.normal(3.5, 2.5, size=100)
@@ -9,8 +9,6 @@
 # or submit itself to any jurisdiction.                                       #
 ###############################################################################
 
-import os
-from pathlib import Path
 
 import pytest
 
@@ -18,12 +16,8 @@ from pidcalib2 import ref_calib
 
 
 @pytest.fixture
-def test_path():
-    return Path(os.path.dirname(os.path.abspath(__file__)))
-
-
-def test_ref_calib(test_path, tmp_path):
-    config = {
+def config(test_path, tmp_path):
+    return {
         "sample": "Turbo18",
         "magnet": "up",
         "bin_vars": '{"P": "P", "ETA": "ETA", "nTracks": "nTracks"}',
@@ -36,35 +30,18 @@ def test_ref_calib(test_path, tmp_path):
         "verbose": False,
     }
 
+
+def test_ref_calib(config, tmp_path):
     assert ref_calib.ref_calib(config) == pytest.approx(0.8798221261720731)
     assert (tmp_path / "PIDCalibResults.root").exists()
 
-    with pytest.raises(SyntaxError):
-        config = {
-            "sample": "Turbo18",
-            "magnet": "up",
-            "bin_vars": '{"P", "ETA", "nTracks"}',
-            "output_file": str(tmp_path / "test_data/test_data_PIDCalibResults.root"),
-            "merge": False,
-            "ref_file": str(test_path / "test_data/ref_test_data.root"),
-            "ref_tree": "DecayTree",
-            "ref_pars": '{"Bach": ["K", "DLLK > 4"]}',
-            "verbose": False,
-        }
-        ref_calib.ref_calib(config)
 
+@pytest.mark.parametrize(
+    "key,value", [("bin_vars", '{"P", "ETA", "nTracks"}'), ("ref_pars", '{"Bach"}')]
+)
+def test_ref_calib_bad_config(config, key, value):
+    config[key] = value
     with pytest.raises(SyntaxError):
-        config = {
-            "sample": "Turbo18",
-            "magnet": "up",
-            "bin_vars": '{"P": "P", "ETA": "ETA", "nTracks": "nTracks"}',
-            "output_file": str(tmp_path / "test_data/test_data_PIDCalibResults.root"),
-            "merge": False,
-            "ref_file": str(test_path / "test_data/ref_test_data.root"),
-            "ref_tree": "DecayTree",
-            "ref_pars": '{"Bach"}',
-            "verbose": False,
-        }
         ref_calib.ref_calib(config)
 
 
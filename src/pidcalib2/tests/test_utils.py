@@ -9,31 +9,22 @@
 # or submit itself to any jurisdiction.                                       #
 ###############################################################################
 
-import os
-import pickle
-from pathlib import Path
-
+import numpy as np
 import pandas as pd
 import pytest
 
 from pidcalib2 import utils
 
 
-@pytest.fixture
-def test_path():
-    return Path(os.path.dirname(os.path.abspath(__file__)))
-
-
-def test_make_hist(test_path):
-    df = pd.read_csv(str(test_path / "test_data/cal_test_data.csv"), index_col=0)
-    hist = utils.make_hist(df, "Pi", ["P"])
+def test_make_hist(cal_test_df):
+    hist = utils.make_hist(cal_test_df, "Pi", ["P"])
     assert hist.size == 20
     assert hist.sum().value == pytest.approx(71.55106080517815)  # type: ignore
     assert hist[3].value == pytest.approx(13.581349537355582)  # type: ignore
 
 
-def test_create_eff_histograms(test_path):
-    df = pd.read_csv(str(test_path / "test_data/cal_test_data.csv"), index_col=0)
+def test_create_eff_histograms(cal_test_df):
+    df = cal_test_df
 
     particle = "Pi"
     pid_cut = "DLLK>4"
@@ -48,58 +39,137 @@ def test_create_eff_histograms(test_path):
     assert eff_hists["eff_DLLK>4"].size == 20
 
 
-def test_get_per_event_effs(test_path):
-    df_ref = pd.read_csv(str(test_path / "test_data/ref_test_data.csv"), index_col=0)
+def test_get_per_event_effs(ref_test_df, load_eff_hists):
+    df_ref = ref_test_df.copy()
     prefixes = ["Bach"]
     bin_vars = {"P": "P", "ETA": "ETA", "nTracks": "nTracks"}
-    hists = {"Bach": {}}
-    with open(
-        test_path / "test_data/effhists-Turbo18-up-K-DLLK>4-P.ETA.nTracks.pkl", "rb"
-    ) as f:
-        hists["Bach"]["eff"] = pickle.load(f)
-        hists["Bach"]["passing"] = pickle.load(f)
-        hists["Bach"]["total"] = pickle.load(f)
+    hists = {"Bach": load_eff_hists("effhists-Turbo18-up-K-DLLK>4-P.ETA.nTracks.pkl")}
     df_ref = utils.add_bin_indices(df_ref, prefixes, bin_vars, hists)
     # with pytest.warns(RuntimeWarning):
     df_ref = utils.add_efficiencies(df_ref, prefixes, hists)
     assert df_ref.PIDCalibEff.mean() == pytest.approx(0.879822126172073)
     assert df_ref.PIDCalibErr.mean() == pytest.approx(0.0131223551397001)
 
+    pd.testing.assert_frame_equal(
+        utils.add_bin_indices_and_efficiencies(ref_test_df, prefixes, bin_vars, hists),
+        df_ref,
+    )
 
-def test_get_multiparticle_per_event_effs(test_path):
-    df_ref = pd.read_csv(str(test_path / "test_data/ref_test_data.csv"), index_col=0)
+
+def test_get_multiparticle_per_event_effs(ref_test_df, load_eff_hists):
+    df_ref = ref_test_df
     prefixes = ["h1", "h2"]
     bin_vars = {"P": "P"}
-    hists = {"h1": {}}
-    with open(test_path / "test_data/effhists-Turbo18-up-K-DLLK>0-P.pkl", "rb") as f:
-        _extracted_from_test_get_multiparticle_per_event_effs_8(hists, "h1", f)
-    hists["h2"] = {}
-    with open(test_path / "test_data/effhists-Turbo18-up-Pi-DLLK<0-P.pkl", "rb") as f:
-        _extracted_from_test_get_multiparticle_per_event_effs_8(hists, "h2", f)
-    df_ref = utils.add_bin_indices(df_ref, prefixes, bin_vars, hists)
-    df_ref = utils.add_efficiencies(df_ref, prefixes, hists)
+    hists = {
+        "h1": load_eff_hists("effhists-Turbo18-up-K-DLLK>0-P.pkl"),
+        "h2": load_eff_hists("effhists-Turbo18-up-Pi-DLLK<0-P.pkl"),
+    }
+    df_ref = utils.add_bin_indices_and_efficiencies(df_ref, prefixes, bin_vars, hists)
     assert df_ref.PIDCalibEff.mean() == pytest.approx(0.928205513381871)
     assert df_ref.PIDCalibErr.mean() == pytest.approx(0.004805856952295592)
 
 
-def _extracted_from_test_get_multiparticle_per_event_effs_8(hists, arg1, f):
-    hists[arg1]["eff"] = pickle.load(f)
-    hists[arg1]["passing"] = pickle.load(f)
-    hists[arg1]["total"] = pickle.load(f)
-
-
-def test_add_bin_indices(test_path):
-    df_ref = pd.read_csv(str(test_path / "test_data/ref_test_data.csv"), index_col=0)
+def test_add_bin_indices(ref_test_df, load_eff_hists):
+    df_ref = ref_test_df.copy()
     prefixes = ["Bach"]
     bin_vars = {"P": "P", "ETA": "ETA", "nTracks": "nTracks"}
-    hists = {"Bach": {}}
-    with open(
-        test_path / "test_data/effhists-Turbo18-up-K-DLLK>4-P.ETA.nTracks.pkl", "rb"
-    ) as f:
-        hists["Bach"]["eff"] = pickle.load(f)
-        hists["Bach"]["passing"] = pickle.load(f)
-        hists["Bach"]["total"] = pickle.load(f)
+    hists = {"Bach": load_eff_hists("effhists-Turbo18-up-K-DLLK>4-P.ETA.nTracks.pkl")}
     df_ref = utils.add_bin_indices(df_ref, prefixes, bin_vars, hists)
     assert df_ref["Bach_P_PIDCalibBin"].sum() == 623
     assert df_ref["Bach_ETA_PIDCalibBin"].sum() == 120
     assert df_ref["Bach_PIDCalibBin"].sum() == 10438
+
+
+def test_apply_cuts():
+    df = pd.DataFrame({"P": [1.0, 5.0, 10.0, 20.0], "DLLK": [-2.0, 6.0, 3.0, 8.0]})
+    assert utils.evaluate_cuts(df, ["DLLK > 4 and P < 15"]).tolist() == [
+        False,
+        True,
+        False,
+        False,
+    ]
+    assert utils.evaluate_cuts(df, ["2 < P < 15", "not DLLK < 0"]).tolist() == [
+        False,
+        True,
+        True,
+        False,
+    ]
+    assert utils.apply_cuts(df, ["P >= 5", "DLLK > 4 or P > 15"]) == (4, 2)
+    assert df["P"].tolist() == [5.0, 20.0]
+
+
+def test_evaluate_cuts_chained_with_ampersand():
+    df = pd.DataFrame(
+        {"DLLK": [-1.0, 1.0, 1.0], "nTracks": [100, 100, 300], "IsMuon": [0, 0, 1]}
+    )
+    for cut in [
+        "DLLK > 0 & nTracks < 200",
+        "IsMuon==0 & DLLK>0 | nTracks>200",
+        "(DLLK > 0) & (nTracks < 200)",
+    ]:
+        expected = df.eval(cut).to_numpy()
+        assert utils.evaluate_cuts(df, [cut]).tolist() == expected.tolist()
+        assert utils.evaluate_cuts(df, [cut, "DLLK > -5"]).tolist() == (
+            expected.tolist()
+        )
+
+
+def test_get_bin_indices(monkeypatch):
+    edges = np.array([0.0, 1.0, 5.0, 10.0])
+    values = np.array([-1.0, 0.0, 0.5, 1.0, 9.99, 10.0, np.nan])
+    assert utils.get_bin_indices(values, edges).tolist() == [-1, 0, 0, 1, 2, -1, -1]
+
+    # Binnings with a uniform tail are partly binned arithmetically
+    rng = np.random.default_rng(42)
+    for edges in [
+        np.linspace(-1, 1, 21),
+        np.array([0.0, 3.0, 4.0, 5.0, 6.0, 7.0]),
+        np.array([0.0, 0.5, 1.5, 2.0, 2.5, 3.0, 7.5]),
+        np.array([-5.0, 2.0, 7.0]),
+    ]:
+        values = np.concatenate(
+            [rng.uniform(-2, 8, 1000), edges, np.nextafter(edges, -np.inf)]
+        )
+        expected = np.searchsorted(edges, values, side="right") - 1
+        expected[expected >= len(edges) - 1] = -1
+        assert (utils.get_bin_indices(values, edges) == expected).all()
+
+        # The pure NumPy fallback gives the same results
+        with monkeypatch.context() as m:
+            m.setattr(utils, "numba", None)
+            assert (utils.get_bin_indices(values, edges) == expected).all()
+
+
+def test_combine_track_efficiencies(monkeypatch):
+    effs = np.array([[0.5, 0.0, np.nan, 0.9], [0.8, 0.7, 0.6, -0.1]])
+    errs = np.array([[0.05, 0.01, 0.1, 0.09], [0.08, 0.07, 0.06, 0.01]])
+    event_effs, event_errs = utils.combine_track_efficiencies(effs, errs)
+    assert event_effs[0] == pytest.approx(0.4)
+    assert event_errs[0] == pytest.approx(0.4 * np.sqrt(0.1**2 + 0.1**2))
+    assert np.isnan(event_effs[2]) and np.isnan(event_errs[2])
+
+    # The pure NumPy fallback gives the same results
+    monkeypatch.setattr(utils, "numba", None)
+    fallback = utils.combine_track_efficiencies(effs, errs)
+    np.testing.assert_allclose(fallback[0], event_effs)
+    np.testing.assert_allclose(fallback[1], event_errs)
+
+
+def test_compile_cut():
+    columns = {"DLLK": np.array([-2.0, 6.0, 3.0]), "P": np.array([1.0, 5.0, 20.0])}
+    cut = utils.compile_cut("DLLK > 0 and not P > 10")
+    assert cut(columns).tolist() == [False, True, False]
+    assert utils.compile_cut("DLLK > 0 and not P > 10") is cut
+    with pytest.raises(KeyError):
+        utils.compile_cut("PIDe > 0")(columns)
+
+
+def test_find_similar_strings(monkeypatch):
+    strings = ["probe_PIDK", "probe_P", "nTracks", "probe_PIDp", "probe_ETA"]
+    expected = ["probe_PIDK", "probe_PIDp", "probe_P"]
+    assert utils.find_similar_strings("probe_PIDk", strings, 0.8) == expected
+    assert utils.find_similar_strings("ETA", strings, 0.8) == []
+
+    # The difflib fallback gives the same results
+    monkeypatch.setattr(utils, "rapidfuzz", None)
+    assert utils.find_similar_strings("probe_PIDk", strings, 0.8) == expected
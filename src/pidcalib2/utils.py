@@ -9,10 +9,14 @@
 # or submit itself to any jurisdiction.                                       #
 ###############################################################################
 
+import ast
+import concurrent.futures
 import difflib
+import functools
+import os
 import re
 import sys
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
 
 import boost_histogram as bh
 import numpy as np
@@ -22,6 +26,32 @@ from tqdm import tqdm
 
 from . import binning, pid_data
 
+try:
+    import numba
+except ImportError:
+    numba = None  # type: ignore
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+try:
+    import rapidfuzz
+except ImportError:
+    rapidfuzz = None  # type: ignore
+
+# Maximum number of entries of bin index lookup tables for integer binnings
+_MAX_LOOKUP_TABLE = 2**16
+
+# Maximum number of calibration files processed concurrently
+_MAX_FILE_WORKERS = min(4, os.cpu_count() or 1)
+
+# Operators and parentheses separating variable names in simple cut expressions
+_CUT_SEPARATORS = re.compile(r"<|>|==|!=|\(|\)|\*|/|\+|-|\^|&")
+_VARIABLE_NAME = re.compile("^[A-Za-z0-9_]+$")
+_WHITESPACE = re.compile(r"\s+")
+
 
 def make_hist(df: pd.DataFrame, particle: str, bin_vars: List[str]) -> bh.Histogram:
     """Create a histogram of sWeighted events with appropriate binning
@@ -38,12 +68,13 @@ def make_hist(df: pd.DataFrame, particle: str, bin_vars: List[str]) -> bh.Histog
     for bin_var in bin_vars:
         bin_edges = binning.get_binning(particle, bin_var)
         axis_list.append(bh.axis.Variable(bin_edges, metadata={"name": bin_var}))
-        vals = df[bin_var].values
-        vals_list.append(vals)
+        vals_list.append(df[bin_var].to_numpy())
 
-    # Create boost-histogram with the desired axes, and fill with sWeight applied
+    # Create boost-histogram with the desired axes, and fill with sWeight applied.
+    # Bare arrays are passed so that boost-histogram fills straight from their
+    # buffers rather than converting pandas objects.
     hist = bh.Histogram(*axis_list, storage=bh.storage.Weight())
-    hist.fill(*vals_list, weight=df["sWeight"])
+    hist.fill(*vals_list, weight=df["sWeight"].to_numpy())
 
     return hist
 
@@ -58,7 +89,10 @@ def create_eff_histograms(hists: Dict[str, bh.Histogram]) -> Dict[str, bh.Histog
         A dictionary with all the efficiency histograms, with the PID cuts as
         keys.
     """
-    zero_bins = np.count_nonzero(hists["total"].values(flow=False) == 0)
+    total_values = hists["total"].values(flow=False)
+    total_variances = hists["total"].variances(flow=False)
+    assert total_variances is not None
+    zero_bins = np.count_nonzero(total_values == 0)
     if zero_bins:
         log.warning(
             (
@@ -66,33 +100,30 @@ def create_eff_histograms(hists: Dict[str, bh.Histogram]) -> Dict[str, bh.Histog
                 "You might want to change the binning."
             )
         )
-        log.debug(hists["total"].values(flow=False))
+        log.debug(total_values)
 
-        # Replace zeros with NaNs which suppresses duplicate Numpy warnings
-        hist_total_nan = hists["total"].values()
-        hist_total_nan[hist_total_nan == 0] = np.nan
-        hists["total"].view().value = hist_total_nan  # type: ignore
+        # Divide by NaNs instead of zeros, which suppresses duplicate Numpy
+        # warnings; the total histogram itself is left untouched
+        total_values = np.where(total_values == 0, np.nan, total_values)
 
     for name in list(hists):
         if name.startswith("passing_"):
             eff_name = name.replace("passing_", "eff_", 1)
+            passing_values = hists[name].values(flow=False)
+            eff_values = passing_values / total_values
             hists[eff_name] = hists[name].copy()
-            hists[eff_name].view().value = hists[name].values(flow=False) / hists[  # type: ignore # noqa
-                "total"
-            ].values(
-                flow=False
-            )
+            hists[eff_name].view().value = eff_values  # type: ignore
             hists[eff_name].view().variance = np.square(  # type: ignore
                 binomial_uncertainty(
-                    hists[name].values(flow=False),
-                    hists["total"].values(flow=False),
+                    passing_values,
+                    total_values,
                     hists[name].variances(flow=False),  # type: ignore
-                    hists["total"].variances(flow=False),  # type: ignore
+                    total_variances,
                 )
             )
             log.debug(f"Created '{eff_name}' histogram")
 
-            negative_bins = np.count_nonzero(hists[eff_name].values(flow=False) < 0)
+            negative_bins = np.count_nonzero(eff_values < 0)
             if negative_bins:
                 log.warning(
                     (
@@ -100,13 +131,7 @@ def create_eff_histograms(hists: Dict[str, bh.Histogram]) -> Dict[str, bh.Histog
                         "efficiency histogram! You might want to change the binning."
                     )
                 )
-                log.debug(hists[eff_name].values(flow=False))
-
-    if zero_bins:
-        # Return the zeros that were temporarily replaced by NaNs
-        hists["total"].view().value = np.nan_to_num(  # type:ignore
-            hists["total"].view().value  # type:ignore
-        )
+                log.debug(eff_values)
 
     return hists
 
@@ -143,43 +168,249 @@ def add_bin_indices(
         bin_vars: Variables used for binning.
         eff_hists: Efficiency histograms for each prefix/particle.
     """
-    df_new = df.copy()
-    for prefix in prefixes:
-        eff_histo = eff_hists[prefix]["eff"]
-        axes = [
-            pid_data.get_reference_branch_name(
-                prefix, axis.metadata["name"], bin_vars[axis.metadata["name"]]
-            )
-            for axis in eff_histo.axes
-        ]
-        for bin_var, branch_name in bin_vars.items():
-            ref_branch_name = pid_data.get_reference_branch_name(
-                prefix, bin_var, branch_name
-            )
-            bins = []
-            for axis in eff_histo.axes:
-                if axis.metadata["name"] == bin_var:
-                    bins = axis.edges
-            df_new[f"{ref_branch_name}_PIDCalibBin"] = pd.cut(
-                df_new[ref_branch_name],
-                bins,
-                labels=False,
-                include_lowest=True,
-                right=False,
-                precision=0,
-            )
+    arrays = {column: df[column].to_numpy() for column in df}
+    return df.assign(**calculate_bin_indices(arrays, prefixes, bin_vars, eff_hists))
+
+
+def calculate_bin_indices(
+    arrays: Dict[str, np.ndarray],
+    prefixes: List[str],
+    bin_vars: Dict[str, str],
+    eff_hists: Dict[str, Dict[str, bh.Histogram]],
+) -> Dict[str, np.ndarray]:
+    """Return bin indices of events stored as a dictionary of column arrays.
+
+    This is the array-based core of add_bin_indices; see its docstring for
+    details. Indices of events outside the binning are NaN.
 
-        df_nan = df_new[df_new.isna().any(axis=1)]  # type: ignore
-        df_new.dropna(inplace=True)
-        index_names = [f"{axis}_PIDCalibBin" for axis in axes]
-        indices = np.ravel_multi_index(
-            df_new[index_names].transpose().to_numpy().astype(int),
-            eff_histo.axes.size,
+    Args:
+        arrays: Input columns; all must be of the same length.
+        prefixes: Branch prefixes of the particles in the reference sample.
+        bin_vars: Variables used for binning.
+        eff_hists: Efficiency histograms for each prefix/particle.
+
+    Returns:
+        A dictionary with the new bin index columns.
+    """
+    def prefix_bin_indices(prefix):
+        return _calculate_prefix_bin_indices(
+            arrays, prefix, bin_vars, eff_hists[prefix]["eff"]
         )
-        df_new[f"{prefix}_PIDCalibBin"] = indices
-        df_new = pd.concat([df_new, df_nan]).sort_index()  # type: ignore
+
+    # The particles are independent of each other. The Numba kernels are
+    # parallel themselves; otherwise the particles are processed in threads
+    # (NumPy releases the GIL in the lookups).
+    if numba is None and len(prefixes) > 1:
+        max_workers = min(len(prefixes), os.cpu_count() or 1)
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            results = list(executor.map(prefix_bin_indices, prefixes))
+    else:
+        results = [prefix_bin_indices(prefix) for prefix in prefixes]
+
+    # Events with a missing value in any column can't be assigned a global bin
+    valid = _not_nan(arrays)
+    bin_indices = {}
+    for prefix, (axis_indices, in_range, indices) in zip(prefixes, results):
+        bin_indices.update(axis_indices)
+        valid &= in_range
+        bin_indices[f"{prefix}_PIDCalibBin"] = _expand_with_nan(indices[valid], valid)
     log.debug("Bin indices assigned")
-    return df_new  # type: ignore
+    return bin_indices
+
+
+def _calculate_prefix_bin_indices(
+    arrays: Dict[str, np.ndarray],
+    prefix: str,
+    bin_vars: Dict[str, str],
+    eff_histo: bh.Histogram,
+) -> Tuple[Dict[str, np.ndarray], np.ndarray, np.ndarray]:
+    """Return bin indices of a single particle.
+
+    Returns:
+        A tuple of the per-variable bin index columns, a mask of events inside
+        the binning in all variables, and the global bin indices (only
+        meaningful inside the binning).
+    """
+    edges = {axis.metadata["name"]: axis.edges for axis in eff_histo.axes}
+    axis_indices = {}
+    columns = {}
+    in_range_all = np.ones(len(next(iter(arrays.values()))), dtype=bool)
+    for bin_var, branch_name in bin_vars.items():
+        ref_branch_name = pid_data.get_reference_branch_name(
+            prefix, bin_var, branch_name
+        )
+        indices = get_bin_indices(
+            np.asarray(arrays[ref_branch_name], dtype=np.float64),
+            edges.get(bin_var, np.empty(0)),
+        )
+        in_range = indices >= 0
+        in_range_all &= in_range
+        axis_indices[bin_var] = indices
+        columns[f"{ref_branch_name}_PIDCalibBin"] = _expand_with_nan(
+            indices[in_range], in_range
+        )
+
+    # Global (C-order) bin index accumulated axis by axis from the last one,
+    # which varies fastest; events outside the binning get bin 0
+    indices = np.zeros(len(in_range_all), dtype=np.intp)
+    stride = 1
+    for axis in reversed(eff_histo.axes):
+        indices += stride * axis_indices[axis.metadata["name"]]
+        stride *= axis.size
+    indices[~in_range_all] = 0
+    return columns, in_range_all, indices
+
+
+def _not_nan(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    """Return a mask of rows that have no NaN in any of the arrays."""
+    num_rows = len(next(iter(arrays.values()))) if arrays else 0
+    mask = np.ones(num_rows, dtype=bool)
+    for values in arrays.values():
+        if values.dtype.kind in "fc":
+            mask &= ~np.isnan(values)
+    return mask
+
+
+def get_bin_indices(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Return indices of the bins into which values fall.
+
+    The bins are closed on the left and open on the right, i.e., [low, high).
+
+    Args:
+        values: Values to be binned.
+        edges: Monotonically increasing bin edges.
+
+    Returns:
+        An integer array of bin indices, with -1 for values outside the
+        binning (including NaNs).
+    """
+    num_bins = len(edges) - 1
+    if num_bins < 1:
+        return np.full(values.shape, -1, dtype=np.int64)
+
+    if numba is not None and _is_integer_binning(edges):
+        # All the bin edges are integers (e.g., nTracks), so the bin of a value
+        # is that of its floor, which can be read from a small lookup table
+        indices = np.empty(values.shape, dtype=np.int64)
+        _lookup_bin_indices_numba(
+            np.ascontiguousarray(values, dtype=np.float64),
+            edges[0],
+            edges[-1],
+            _integer_lookup_table(tuple(edges)),
+            indices,
+        )
+        return indices
+
+    tail = _uniform_tail_start(edges)
+    if numba is not None:
+        indices = np.empty(values.shape, dtype=np.int64)
+        _bin_indices_numba(
+            np.ascontiguousarray(values, dtype=np.float64),
+            np.ascontiguousarray(edges, dtype=np.float64),
+            tail if num_bins - tail >= 2 else num_bins,
+            indices,
+        )
+        return indices
+
+    if num_bins - tail < 2:
+        indices = np.searchsorted(edges, values, side="right") - 1
+        indices[indices >= num_bins] = -1
+        return indices
+
+    # Values in the uniform part of the binning are binned arithmetically,
+    # which is much faster than a binary search; the rest uses searchsorted.
+    indices = np.empty(values.shape, dtype=np.int64)
+    upper = values >= edges[tail]
+    lower = ~upper
+    head = np.searchsorted(edges[: tail + 1], values[lower], side="right") - 1
+    head[head >= tail] = -1  # NaNs
+    indices[lower] = head
+
+    x = values[upper]
+    scale = (num_bins - tail) / (edges[-1] - edges[tail])
+    idx = np.minimum((x - edges[tail]) * scale, num_bins - tail).astype(np.int64)
+    idx += tail
+    # Correct off-by-one errors due to rounding so that the indices are
+    # identical to those from searchsorted
+    idx -= x < edges[idx]
+    idx += (idx < num_bins) & (x >= edges[np.minimum(idx + 1, num_bins)])
+    indices[upper] = idx
+    indices[indices >= num_bins] = -1
+    return indices
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _bin_indices_numba(values, edges, tail, indices):
+        # Single pass over the values; bins from the tail edge onwards are
+        # uniform and are found arithmetically, the rest by a binary search
+        num_bins = len(edges) - 1
+        low = edges[tail]
+        scale = (num_bins - tail) / (edges[-1] - low) if tail < num_bins else 0.0
+        for i in numba.prange(len(values)):
+            x = values[i]
+            if not (x >= edges[0] and x < edges[-1]):  # Also true for NaNs
+                indices[i] = -1
+            elif x >= low:
+                idx = tail + min(int((x - low) * scale), num_bins - tail - 1)
+                # Correct off-by-one errors due to rounding
+                if x < edges[idx]:
+                    idx -= 1
+                elif x >= edges[idx + 1]:
+                    idx += 1
+                indices[i] = idx
+            else:
+                indices[i] = np.searchsorted(edges[: tail + 1], x, side="right") - 1
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _lookup_bin_indices_numba(values, low, high, table, indices):
+        for i in numba.prange(len(values)):
+            x = values[i]
+            if x >= low and x < high:
+                indices[i] = table[int(np.floor(x) - low)]
+            else:
+                indices[i] = -1
+
+
+def _is_integer_binning(edges: np.ndarray) -> bool:
+    """Return whether all bin edges are integers spanning a short range."""
+    return bool(
+        np.all(np.mod(edges, 1) == 0) and edges[-1] - edges[0] <= _MAX_LOOKUP_TABLE
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _integer_lookup_table(edges: Tuple[float, ...]) -> np.ndarray:
+    """Return bin indices of all the integers from the first to the last edge."""
+    integers = np.arange(edges[0], edges[-1])
+    return np.searchsorted(edges, integers, side="right") - 1
+
+
+def _uniform_tail_start(edges: np.ndarray) -> int:
+    """Return the index of the first edge of the uniform tail of a binning."""
+    widths = np.diff(edges)
+    if len(widths) == 0:
+        return 0
+    irregular = ~np.isclose(widths, widths[-1], rtol=1e-9, atol=0)
+    if not irregular.any():
+        return 0
+    return len(widths) - int(np.argmax(irregular[::-1]))
+
+
+def _expand_with_nan(values: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Spread values over the True entries of mask and fill the rest with NaN.
+
+    The dtype of values is kept when the mask has no False entries.
+    """
+    if mask.all():
+        return values
+    expanded = np.full(mask.shape, np.nan)
+    expanded[mask] = values
+    return expanded
 
 
 def add_efficiencies(
@@ -199,59 +430,90 @@ def add_efficiencies(
         eff_hists: Efficiency histograms for each prefix/particle.
         compatibility: Treat empty efficiency histogram bins as PIDCalib1 did
     """
-    df_new = df.copy()
+    arrays = {column: df[column].to_numpy() for column in df}
+    return df.assign(
+        **calculate_efficiencies(arrays, prefixes, eff_hists, compatibility)
+    )
 
-    # We separate the dataframe into two parts: one where all the events have
-    # PID indices (events inside the PID binning) and those that don't.
-    # Efficiency is added only for events inside the PID binning.
-    df_nan = df_new[df_new.isna().any(axis=1)]  # type: ignore
-    df_new.dropna(inplace=True)
 
-    df_new["PIDCalibEff"] = 1
-    df_new["PIDCalibRelErr2"] = 0
+def add_bin_indices_and_efficiencies(
+    df: pd.DataFrame,
+    prefixes: List[str],
+    bin_vars: Dict[str, str],
+    eff_hists: Dict[str, Dict[str, bh.Histogram]],
+    compatibility: bool = False,
+) -> pd.DataFrame:
+    """Return a DataFrame with added bin indices and efficiencies.
 
-    for prefix in prefixes:
-        efficiency_table = eff_hists[prefix]["eff"].values().flatten()
-        error_table = np.sqrt(eff_hists[prefix]["eff"].variances().flatten())  # type: ignore # noqa
+    This is equivalent to add_efficiencies(add_bin_indices(df, ...), ...), but
+    the columns are extracted only once and a single new DataFrame is created.
 
-        # The original PIDCalib assigned bins with no events in the total
-        # histogram an efficiency of zero. This should not come up often and the
-        # user should be warned about it. In any case it does not seem right -
-        # we assign the bin a NaN. This might cause slightly different results
-        # when using a sample and binning that lead to such empty bins.
-        if compatibility:
-            np.nan_to_num(efficiency_table, copy=False)  # Replicate PIDCalib1 behavior
+    Args:
+        df: Input dataframe.
+        prefixes: Branch prefixes of the particles in the reference sample.
+        bin_vars: Variables used for binning.
+        eff_hists: Efficiency histograms for each prefix/particle.
+        compatibility: Treat empty efficiency histogram bins as PIDCalib1 did
+    """
+    arrays = {column: df[column].to_numpy() for column in df}
+    bin_indices = calculate_bin_indices(arrays, prefixes, bin_vars, eff_hists)
+    efficiencies = calculate_efficiencies(
+        {**arrays, **bin_indices}, prefixes, eff_hists, compatibility
+    )
+    return df.assign(**bin_indices, **efficiencies)
 
-        # Assign efficiencies by taking the efficiency value from the relevant bin
-        df_new[f"{prefix}_PIDCalibEff"] = np.take(
-            efficiency_table, df_new[f"{prefix}_PIDCalibBin"]
-        )
-        # Assign errors by taking the error value from the relevant bin
-        df_new[f"{prefix}_PIDCalibErr"] = np.take(
-            error_table, df_new[f"{prefix}_PIDCalibBin"]
-        )
-        df_new["PIDCalibEff"] *= df_new[f"{prefix}_PIDCalibEff"]
-        df_new["PIDCalibRelErr2"] += (
-            df_new[f"{prefix}_PIDCalibErr"] / df_new[f"{prefix}_PIDCalibEff"]
-        ) ** 2
 
-    df_new["PIDCalibErr"] = np.sqrt(df_new["PIDCalibRelErr2"])  # type: ignore
-    for prefix in prefixes:
-        # The absolute value is so that we match PIDCalib1. However if any of
-        # the efficiencies are negative the overall efficiency and error are
-        # meaningless.
-        df_new["PIDCalibErr"] *= df_new[f"{prefix}_PIDCalibEff"]  # type: ignore
-    df_new.drop(columns=["PIDCalibRelErr2"], inplace=True)
+def calculate_efficiencies(
+    arrays: Dict[str, np.ndarray],
+    prefixes: List[str],
+    eff_hists: Dict[str, Dict[str, bh.Histogram]],
+    compatibility: bool = False,
+    tables: Optional[Dict[str, Tuple[np.ndarray, np.ndarray]]] = None,
+) -> Dict[str, np.ndarray]:
+    """Return efficiencies of events stored as a dictionary of column arrays.
+
+    This is the array-based core of add_efficiencies; see its docstring for
+    details. Efficiencies of events outside the binning are NaN.
+
+    Args:
+        arrays: Input columns, including the bin indices; all must be of the
+            same length.
+        prefixes: Branch prefixes of the particles in the reference sample.
+        eff_hists: Efficiency histograms for each prefix/particle.
+        compatibility: Treat empty efficiency histogram bins as PIDCalib1 did
+        tables: Optional. Lookup tables from get_efficiency_tables. Passing
+            them avoids rebuilding the tables when processing many chunks.
+
+    Returns:
+        A dictionary with the new efficiency and error columns.
+    """
+    # Efficiency is added only for events inside the PID binning, i.e., events
+    # that have all the PID bin indices. Only those columns can tell; there is
+    # no need to scan the rest of the input.
+    valid = _not_nan({prefix: arrays[f"{prefix}_PIDCalibBin"] for prefix in prefixes})
+
+    if tables is None:
+        tables = get_efficiency_tables(eff_hists, prefixes, compatibility)
+
+    # Rows are tracks (one per prefix), columns are events. Events outside the
+    # binning look up bin 0 so that all the events are processed uniformly;
+    # their values are replaced by NaN at the end.
+    effs = np.empty((len(prefixes), len(valid)))
+    errs = np.empty((len(prefixes), len(valid)))
+    for i, prefix in enumerate(prefixes):
+        efficiency_table, error_table = tables[prefix]
+        # Take the efficiency and error values from the relevant bins
+        bin_indices = np.where(valid, arrays[f"{prefix}_PIDCalibBin"], 0).astype(int)
+        np.take(efficiency_table, bin_indices, out=effs[i])
+        np.take(error_table, bin_indices, out=errs[i])
+    event_effs, event_errs = combine_track_efficiencies(effs, errs)
 
     # Assign -999 to events where any track has negative efficiency; this
     # behavior is different to the original PIDCalib
-    negative_mask = df_new.eval(
-        "|".join(f"{prefix}_PIDCalibEff<0" for prefix in prefixes)
-    )
-
-    if any(negative_mask):
-        df_new.loc[negative_mask, ["PIDCalibEff"]] = -999
-        df_new.loc[negative_mask, ["PIDCalibErr"]] = -999
+    negative_mask = (effs < 0).any(axis=0) & valid
+    if negative_mask.any():
+        event_effs[negative_mask] = -999
+        event_errs[negative_mask] = -999
         log.warning(
             (
                 f"{np.count_nonzero(negative_mask)} events include tracks with "
@@ -259,18 +521,112 @@ def add_efficiencies(
             )
         )
 
-    df_new = pd.concat([df_new, df_nan]).sort_index()
+    if not valid.all():
+        for values in (effs, errs, event_effs, event_errs):
+            values[..., ~valid] = np.nan
+
+    efficiencies = {"PIDCalibEff": event_effs}
+    for prefix, track_eff, track_err in zip(prefixes, effs, errs):
+        efficiencies[f"{prefix}_PIDCalibEff"] = track_eff
+        efficiencies[f"{prefix}_PIDCalibErr"] = track_err
+    efficiencies["PIDCalibErr"] = event_errs
     log.debug("Particle efficiencies assigned")
 
-    num_outside_range = len(df_nan.index)
-    num_outside_range_frac = len(df_nan.index) / len(df_new.index)
-    log.warning(
+    num_outside_range = np.count_nonzero(~valid)
+    num_outside_range_frac = num_outside_range / len(valid) if len(valid) else 0
+    log.debug(
         (
             "Events out of binning range: "
             f"{num_outside_range} ({num_outside_range_frac:.2%})"
         )
     )
-    return df_new
+    return efficiencies
+
+
+def get_efficiency_tables(
+    eff_hists: Dict[str, Dict[str, bh.Histogram]],
+    prefixes: List[str],
+    compatibility: bool = False,
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """Return flat efficiency and error lookup tables for each prefix.
+
+    The tables are indexed by the global bin indices from add_bin_indices.
+    They are read-only, so they can be shared freely, e.g., across chunks of
+    a large sample.
+
+    Args:
+        eff_hists: Efficiency histograms for each prefix/particle.
+        prefixes: Branch prefixes of the particles in the reference sample.
+        compatibility: Treat empty efficiency histogram bins as PIDCalib1 did
+
+    Returns:
+        A dictionary of (efficiency table, error table) tuples.
+    """
+    tables = {}
+    for prefix in prefixes:
+        efficiency_table = eff_hists[prefix]["eff"].values().flatten()
+        error_table = np.sqrt(eff_hists[prefix]["eff"].variances().flatten())  # type: ignore # noqa
+
+        # The original PIDCalib assigned bins with no events in the total
+        # histogram an efficiency of zero. This should not come up often and the
+        # user should be warned about it. In any case it does not seem right -
+        # we assign the bin a NaN. This might cause slightly different results
+        # when using a sample and binning that lead to such empty bins.
+        if compatibility:
+            np.nan_to_num(efficiency_table, copy=False)  # Replicate PIDCalib1 behavior
+
+        efficiency_table.setflags(write=False)
+        error_table.setflags(write=False)
+        tables[prefix] = (efficiency_table, error_table)
+    return tables
+
+
+def combine_track_efficiencies(
+    effs: np.ndarray, errs: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return event efficiencies and errors from those of individual tracks.
+
+    The event efficiency is the product of the track efficiencies and the
+    relative errors of the tracks are added in quadrature. A compiled parallel
+    kernel is used when Numba is installed.
+
+    Args:
+        effs: Track efficiencies with shape (number of tracks, number of events).
+        errs: Track efficiency errors with the same shape as effs.
+
+    Returns:
+        A tuple of event efficiencies and event efficiency errors.
+    """
+    effs = np.ascontiguousarray(effs, dtype=np.float64)
+    errs = np.ascontiguousarray(errs, dtype=np.float64)
+    if numba is not None:
+        event_effs = np.empty(effs.shape[1])
+        event_errs = np.empty(effs.shape[1])
+        _combine_track_efficiencies_numba(effs, errs, event_effs, event_errs)
+        return event_effs, event_errs
+
+    event_effs = np.prod(effs, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # The absolute value is so that we match PIDCalib1. However if any of
+        # the efficiencies are negative the overall efficiency and error are
+        # meaningless.
+        event_errs = np.sqrt(np.sum((errs / effs) ** 2, axis=0)) * event_effs
+    return event_effs, event_errs
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True, error_model="numpy")
+    def _combine_track_efficiencies_numba(effs, errs, event_effs, event_errs):
+        num_tracks, num_events = effs.shape
+        for event in numba.prange(num_events):
+            eff = 1.0
+            rel_err2 = 0.0
+            for track in range(num_tracks):
+                eff *= effs[track, event]
+                rel_err2 += (errs[track, event] / effs[track, event]) ** 2
+            event_effs[event] = eff
+            event_errs[event] = np.sqrt(rel_err2) * eff
 
 
 def create_hist_filename(
@@ -285,8 +641,7 @@ def create_hist_filename(
         pid_cut: Simplified user-level cut, e.g., "DLLK < 4".
         bin_vars: Variables used for binning.
     """
-    whitespace = re.compile(r"\s+")
-    cut = re.sub(whitespace, "", pid_cut)
+    cut = _WHITESPACE.sub("", pid_cut)
 
     return f"effhists-{sample}-{magnet}-{particle}-{cut}-{'.'.join(bin_vars)}.pkl"
 
@@ -337,16 +692,164 @@ def create_error_histogram(eff_hists: Dict[str, bh.Histogram]) -> bh.Histogram:
 
 
 def apply_cuts(df: pd.DataFrame, cuts: List[str]) -> Tuple[int, int]:
-    cut_string = " and ".join(cuts)
     num_before = df.shape[0]
-    df.query(cut_string, inplace=True)
+    mask = evaluate_cuts(df, cuts)
+    if not mask.all():
+        if not df.index.is_unique:
+            df.reset_index(drop=True, inplace=True)
+        df.drop(index=df.index[~mask], inplace=True)
     num_after = df.shape[0]
-    log.debug(
-        f"{num_after}/{num_before} ({num_after/num_before:.1%}) events passed cuts"
-    )
+    if num_before:
+        log.debug(
+            f"{num_after}/{num_before} ({num_after/num_before:.1%}) events passed cuts"
+        )
     return num_before, num_after
 
 
+def evaluate_cuts(df: pd.DataFrame, cuts: List[str]) -> np.ndarray:
+    """Evaluate cuts on a DataFrame and return the mask of passing events.
+
+    The cuts are evaluated with numexpr directly on the column arrays when
+    possible, bypassing the pandas query machinery. Expressions numexpr cannot
+    handle fall back to DataFrame.eval.
+
+    Args:
+        df: DataFrame with the variables used in the cuts.
+        cuts: Cuts to be combined with a logical "and".
+
+    Returns:
+        A boolean array with one entry per row of the DataFrame.
+    """
+    mask = np.ones(df.shape[0], dtype=bool)
+    if numexpr is not None and len(cuts) > 1:
+        # Fuse all the cuts into a single numexpr pass when possible
+        try:
+            expression, var_names = _combine_numexpr(tuple(cuts))
+            columns = {name: df[name].to_numpy() for name in var_names}
+            mask &= numexpr.evaluate(expression, local_dict=columns)
+            return mask
+        # AttributeError covers Python < 3.9, which lacks ast.unparse
+        except (AttributeError, SyntaxError, KeyError, ValueError, TypeError):
+            log.debug("Cuts not supported by numexpr as a single expression")
+    for cut in cuts:
+        mask &= _evaluate_cut(df, cut)
+    return mask
+
+
+def _evaluate_cut(df: pd.DataFrame, cut: str) -> np.ndarray:
+    if numexpr is not None:
+        try:
+            expression, var_names = _to_numexpr(cut)
+            columns = {name: df[name].to_numpy() for name in var_names}
+            return np.broadcast_to(
+                numexpr.evaluate(expression, local_dict=columns), df.shape[0]
+            )
+        # AttributeError covers Python < 3.9, which lacks ast.unparse
+        except (AttributeError, SyntaxError, KeyError, ValueError, TypeError):
+            log.debug(f"Cut '{cut}' not supported by numexpr")
+    try:
+        return np.broadcast_to(
+            np.asarray(compile_cut(cut)(df), dtype=bool), df.shape[0]
+        )
+    except (SyntaxError, KeyError, NameError, ValueError, TypeError):
+        log.debug(f"Cut '{cut}' could not be compiled, using pandas")
+    return df.eval(cut).to_numpy(dtype=bool)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_cut(cut: str) -> Callable[[Mapping[str, Any]], np.ndarray]:
+    """Compile a cut into a function that evaluates it on column arrays.
+
+    The cut is parsed only once; the returned function applies NumPy's
+    elementwise operators directly to the columns it references.
+
+    Args:
+        cut: The cut to compile, e.g., "DLLK > 4 and P < 100000".
+
+    Returns:
+        A function taking a mapping of column names to arrays (e.g., a dict or
+        a DataFrame) and returning a boolean array of passing events.
+    """
+    tree = _NumexprTransformer().visit(ast.parse(cut.strip(), mode="eval"))
+    var_names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    code = compile(ast.fix_missing_locations(tree), "<cut>", "eval")
+
+    def evaluate(columns: Mapping[str, Any]) -> np.ndarray:
+        namespace = {name: np.asarray(columns[name]) for name in var_names}
+        return eval(code, {"__builtins__": {}}, namespace)
+
+    return evaluate
+
+
+class _NumexprTransformer(ast.NodeTransformer):
+    """Rewrite Python boolean syntax into the bitwise form numexpr expects."""
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        return functools.reduce(
+            lambda left, right: ast.BinOp(left=left, op=op, right=right), node.values
+        )
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        return node
+
+    def visit_BinOp(self, node):
+        # "A > 0 & B < 2" parses as "A > (0 & B) < 2" in Python, while pandas
+        # gives & and | a lower precedence than comparisons. Leave such cuts to
+        # DataFrame.eval unless both operands are already boolean.
+        if isinstance(node.op, (ast.BitAnd, ast.BitOr)) and not all(
+            _is_boolean_node(operand) for operand in (node.left, node.right)
+        ):
+            raise ValueError("'&' or '|' applied to non-boolean operands")
+        self.generic_visit(node)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        # Split chained comparisons, e.g., 0 < P < 10 -> (0 < P) & (P < 10)
+        operands = [node.left] + node.comparators
+        comparisons = [
+            ast.Compare(left=left, ops=[op], comparators=[right])
+            for left, op, right in zip(operands, node.ops, operands[1:])
+        ]
+        return functools.reduce(
+            lambda left, right: ast.BinOp(left=left, op=ast.BitAnd(), right=right),
+            comparisons,
+        )
+
+
+def _is_boolean_node(node: ast.AST) -> bool:
+    if isinstance(node, ast.BinOp):
+        return isinstance(node.op, (ast.BitAnd, ast.BitOr)) and all(
+            _is_boolean_node(operand) for operand in (node.left, node.right)
+        )
+    if isinstance(node, ast.UnaryOp):
+        return isinstance(node.op, ast.Not) or (
+            isinstance(node.op, ast.Invert) and _is_boolean_node(node.operand)
+        )
+    return isinstance(node, (ast.Compare, ast.BoolOp))
+
+
+@functools.lru_cache(maxsize=None)
+def _to_numexpr(cut: str) -> Tuple[str, Tuple[str, ...]]:
+    tree = _NumexprTransformer().visit(ast.parse(cut.strip(), mode="eval"))
+    var_names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    return ast.unparse(ast.fix_missing_locations(tree)), tuple(sorted(var_names))
+
+
+@functools.lru_cache(maxsize=None)
+def _combine_numexpr(cuts: Tuple[str, ...]) -> Tuple[str, Tuple[str, ...]]:
+    expressions, var_names = zip(*(_to_numexpr(cut) for cut in cuts))
+    combined = " & ".join(f"({expression})" for expression in expressions)
+    return combined, tuple(sorted(set().union(*var_names)))
+
+
 def extract_variable_names(expression: str) -> List[str]:
     """Extract variable names from simple math expressions.
 
@@ -358,11 +861,11 @@ def extract_variable_names(expression: str) -> List[str]:
     Returns:
         A list of variable names found in the expression.
     """
-    parts = re.split(r"<|>|==|!=|\(|\)|\*|/|\+|-|\^|&", expression)
+    parts = _CUT_SEPARATORS.split(expression)
     var_names = [part for part in parts if not is_float(part) and part != ""]
     # Check that the user uses valid variable names in cuts
     for var_name in var_names:
-        if not re.match("^[A-Za-z0-9_]+$", var_name):
+        if not _VARIABLE_NAME.match(var_name):
             if "=" in var_name:
                 log.error("A single '=' used in a cut. Did you mean '=='?")
                 raise SyntaxError
@@ -390,11 +893,26 @@ def find_similar_strings(
 ) -> List[str]:
     """Return a list of strings similar to the comparison string.
 
+    The strings are sorted from the most to the least similar. RapidFuzz is
+    used to compute the similarity when installed, difflib otherwise.
+
     Args:
         comparison_string: The string against which to compare.
         list_of_strings: List of strings to search.
         ratio: Minimal SequenceMatcher similarity ratio.
     """
+    if rapidfuzz is not None:
+        matches = rapidfuzz.process.extract(
+            comparison_string.lower(),
+            [string.lower() for string in list_of_strings],
+            scorer=rapidfuzz.fuzz.ratio,
+            limit=None,
+            score_cutoff=ratio * 100,
+        )
+        return [
+            list_of_strings[index] for _, score, index in matches if score > ratio * 100
+        ]
+
     similar_strings = {}
     for string in list_of_strings:
         string_ratio = difflib.SequenceMatcher(
@@ -472,53 +990,83 @@ def create_histograms(config):
             f"{bin_var} >= {bin_edges[0]} and {bin_var} < {bin_edges[-1]}"
         )
 
-    cut_stats = {
-        "binning range": {"before": 0, "after": 0},
-        "hard-coded": {"before": 0, "after": 0},
-        "user": {"before": 0, "after": 0},
-    }
+    cut_stats = _empty_cut_stats()
     all_hists = {}
 
-    for path in (
-        tqdm(calib_sample["files"], leave=False, desc="Processing files")
-        if sys.stderr.isatty()  # Use tqdm only when running interactively
-        else calib_sample["files"]
-    ):
-        df = pid_data.root_to_dataframe(
-            path, tree_paths, list(branch_names.values()), True
+    # Rename colums of the dataset from branch names to simple user-level
+    # names, e.g., probe_PIDK -> DLLK.
+    inverse_branch_dict = {val: key for key, val in branch_names.items()}
+    branches = list(branch_names.values())
+
+    def process_file(path):
+        # Each file gets its own cut statistics so that the threads don't
+        # share mutable state; they are merged in file order below
+        file_cut_stats = _empty_cut_stats()
+        df = pid_data.root_to_dataframe(path, tree_paths, branches, True)
+        if df is None:
+            return None, file_cut_stats
+
+        df = df.rename(columns=inverse_branch_dict)  # type: ignore
+
+        apply_all_cuts(
+            df,
+            file_cut_stats,
+            binning_range_cuts,
+            calib_sample["cuts"] if "cuts" in calib_sample else [],
+            config["cuts"] if "cuts" in config else [],
         )
-        if df is not None:
-            # Rename colums of the dataset from branch names to simple user-level
-            # names, e.g., probe_PIDK -> DLLK.
-            inverse_branch_dict = {val: key for key, val in branch_names.items()}
-            df = df.rename(columns=inverse_branch_dict)  # type: ignore
-
-            apply_all_cuts(
-                df,
-                cut_stats,
-                binning_range_cuts,
-                calib_sample["cuts"] if "cuts" in calib_sample else [],
-                config["cuts"] if "cuts" in config else [],
-            )
 
-            hists = {"total": make_hist(df, config["particle"], config["bin_vars"])}
-            hists_passing = create_passing_histograms(
-                df,
-                cut_stats,
-                config["particle"],
-                config["bin_vars"],
-                config["pid_cuts"],
-            )
+        hists = {"total": make_hist(df, config["particle"], config["bin_vars"])}
+        hists_passing = create_passing_histograms(
+            df,
+            file_cut_stats,
+            config["particle"],
+            config["bin_vars"],
+            config["pid_cuts"],
+        )
 
-            # Merge dictionaries
-            hists = {**hists, **hists_passing}
-            all_hists[path] = hists
+        # Merge dictionaries
+        return {**hists, **hists_passing}, file_cut_stats
+
+    # Files are processed in a few threads so that reading one file overlaps
+    # with cutting and histogramming another (uproot decompression, numexpr,
+    # and histogram filling release the GIL). The number of threads is kept
+    # small because each thread holds a whole file in memory.
+    max_workers = min(_MAX_FILE_WORKERS, len(calib_sample["files"]) or 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        results = executor.map(process_file, calib_sample["files"])
+        for path, (hists, file_cut_stats) in zip(
+            calib_sample["files"],
+            tqdm(
+                results,
+                total=len(calib_sample["files"]),
+                leave=False,
+                desc="Processing files",
+            )
+            if sys.stderr.isatty()  # Use tqdm only when running interactively
+            else results,
+        ):
+            for name, cut_stat in file_cut_stats.items():
+                total_stat = cut_stats.setdefault(name, {"before": 0, "after": 0})
+                total_stat["before"] += cut_stat["before"]
+                total_stat["after"] += cut_stat["after"]
+            if hists is not None:
+                all_hists[path] = hists
 
     log.info(f"Processed {len(all_hists)}/{len(calib_sample['files'])} files")
     print_cut_summary(cut_stats)
     return all_hists
 
 
+def _empty_cut_stats() -> Dict[str, Dict[str, int]]:
+    """Return cut statistics with zero counts for the standard cuts."""
+    return {
+        "binning range": {"before": 0, "after": 0},
+        "hard-coded": {"before": 0, "after": 0},
+        "user": {"before": 0, "after": 0},
+    }
+
+
 def create_histograms_from_local_dataframe(config):
     branch_names = pid_data.get_relevant_branch_names(
         config["pid_cuts"], config["bin_vars"], config["cuts"]
@@ -535,9 +1083,12 @@ def create_histograms_from_local_dataframe(config):
     pid_cuts = config["pid_cuts"]
 
     hists = {"total": make_hist(df, particle, bin_vars)}
+    # Only the columns needed for the histogram are selected for the passing
+    # events, rather than copying the whole DataFrame for every cut
+    hist_columns = [*bin_vars, "sWeight"]
     for i, pid_cut in enumerate(pid_cuts):
         log.info(f"Processing '{pid_cuts[i]}' cut")
-        df_passing = df.query(pid_cut)
+        df_passing = df.loc[evaluate_cuts(df, [pid_cut]), hist_columns]
         hists[f"passing_{pid_cut}"] = make_hist(df_passing, particle, bin_vars)
         log.debug("Created 'passing' histogram")
 
@@ -576,14 +1127,18 @@ def apply_all_cuts(
 def create_passing_histograms(df, cut_stats, particle, bin_vars, pid_cuts):
     hists = {}
     num_total = len(df.index)
+    # Only the columns needed for the histogram are selected for the passing
+    # events, rather than copying the whole DataFrame for every cut
+    hist_columns = [*bin_vars, "sWeight"]
     for i, pid_cut in enumerate(pid_cuts):
         log.debug(f"Processing '{pid_cuts[i]}' cut")
-        df_passing = df.query(pid_cut)
+        mask = evaluate_cuts(df, [pid_cut])
+        df_passing = df.loc[mask, hist_columns]
         hists[f"passing_{pid_cut}"] = make_hist(df_passing, particle, bin_vars)
         log.debug("Created 'passing' histogram")
         if f"'{pid_cut}'" not in cut_stats:
             cut_stats[f"'{pid_cut}'"] = {"before": 0, "after": 0}
-        cut_stats[f"'{pid_cut}'"]["after"] += len(df_passing.index)
+        cut_stats[f"'{pid_cut}'"]["after"] += np.count_nonzero(mask)
         cut_stats[f"'{pid_cut}'"]["before"] += num_total
     return hists
 